@@ -0,0 +1,97 @@
+"""
+In this script only include the memory benchmark of the product rows: raw sqlite tuples (SELECT *) against ProductRecord
+(__slots__ and only the columns the lists use).
+
+Run it from the project folder:  python -m benchmarks.records_memory --rows 1000000
+"""
+
+import argparse
+import gc
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+# Allow "python benchmarks/records_memory.py" too
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.records import ProductRecord
+
+
+# Create an in-memory products table with the same columns as the real one
+def create_database(rows):
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE products (
+            "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+            "name" TEXT NOT NULL UNIQUE,
+            "price" REAL NOT NULL,
+            "stock" INTEGER DEFAULT 0,
+            "description" TEXT,
+            "category_id" INTEGER,
+            "supplier_id" INTEGER
+            )
+    ''')
+
+    conn.executemany(
+        'INSERT INTO products (name, price, stock, description, category_id, supplier_id) VALUES (?, ?, ?, ?, ?, ?)',
+        (('Product {:07d}'.format(i), 1 + i % 500 / 10, i % 1000, 'No description', 1 + i % 20, 1) for i in range(rows))
+    )
+
+    return conn
+
+
+# Measure the memory kept by the rows returned by load(), and the time to load them
+def measure(load):
+
+    gc.collect()
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    rows = load()
+    elapsed = time.perf_counter() - start
+
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = len(rows)
+    del rows
+
+    return count, current, peak, elapsed
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Memory used by tuples and ProductRecord rows.')
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of products (default 1000000)')
+    args = parser.parse_args()
+
+    conn = create_database(args.rows)
+
+    cases = [
+        ('tuples, SELECT *', lambda: conn.execute('SELECT * FROM products').fetchall()),
+        ('tuples, list columns', lambda: conn.execute('SELECT {} FROM products'.format(ProductRecord.columns())).fetchall()),
+    ]
+
+    def load_records():
+        cursor = conn.cursor()
+        cursor.row_factory = ProductRecord.from_row
+        return cursor.execute('SELECT {} FROM products'.format(ProductRecord.columns())).fetchall()
+
+    cases.append(('ProductRecord, list columns', load_records))
+
+    print('{:<30} {:>10} {:>14} {:>14} {:>12} {:>10}'.format('Rows', 'Count', 'Memory (MB)', 'Peak (MB)', 'Bytes/row', 'Time (s)'))
+
+    for label, load in cases:
+        count, current, peak, elapsed = measure(load)
+        print('{:<30} {:>10} {:>14.1f} {:>14.1f} {:>12.0f} {:>10.2f}'.format(
+            label, count, current / 1024 / 1024, peak / 1024 / 1024, current / max(count, 1), elapsed
+        ))
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
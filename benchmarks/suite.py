@@ -0,0 +1,405 @@
+"""
+In this script only include the benchmark suite of the DatabaseManager methods and the ProductLogic hot paths.
+A database is seeded with the chosen number of sales, every operation is run many times and the p50/p95/p99 latency,
+the throughput and the peak memory are reported, as a table and as JSON. A previous JSON can be used as baseline to find regressions.
+
+Run it from the project folder:
+    python -m benchmarks.suite --size small --output bench.json
+    python -m benchmarks.suite --size small --baseline bench.json
+    python -m benchmarks.suite --rows 2000000 --db /tmp/bench.db --only sales_report
+
+The sales end on a fixed day (--end), so the data and the date ranges of the cases are the same on every day the suite runs.
+
+The write cases that add rows (products, suppliers, clients, categories) delete them in the same case, so every run
+sees the same data. Not measured: the connection plumbing (get_connection, transaction...), the migrations, and the one-off
+maintenance that changes the data for the next cases (archive_sales_year_db, vacuum_db)
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Allow "python benchmarks/suite.py" too
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.database_manager import DatabaseManager
+from modules.product_logic import ProductLogic
+from modules.data_generator import DataGenerator
+
+
+# Number of sales of every size
+SIZES = {
+    'small': 10000,
+    'medium': 1000000,
+    'large': 10000000,
+}
+
+# A case is repeated until it has max_runs runs or it has used its time budget (but at least MIN_RUNS times)
+MIN_RUNS = 3
+
+# Regressions: a case is slower than the baseline when its p50 or p95 grows more than this fraction
+DEFAULT_THRESHOLD = 0.25
+
+# Sales inserted in every transaction while seeding
+SEED_CHUNK_SIZE = 100000
+
+# Last day of the seeded sales (excluded). The date cases are relative to it
+DEFAULT_END = '2026-01-01'
+
+
+# -- SEED --
+
+# Seed function. Fill an empty database with the synthetic data generator (always the same data for a seed and an end day).
+# One product every 100 sales (at least 100), with stock enough for every sale the cases make
+def seed_database(db, sales, seed=0, end=DEFAULT_END):
+
+    generator = DataGenerator(seed=seed, products=max(sales // 100, 100), end=end, stock_range=(1000000, 1000000))
+    generator.generate(db, sales, SEED_CHUNK_SIZE)
+
+
+# -- MEASURE --
+
+# Percentile (nearest rank) of a sorted list
+def percentile(values, fraction):
+
+    if not values:
+        return 0.0
+
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+# Read everything a call returns, so the time includes reading the rows and not only starting the query
+def consume(result):
+
+    if isinstance(result, sqlite3.Cursor):
+        return result.fetchall()
+
+    if hasattr(result, '__next__'):
+        return list(result)
+
+    return result
+
+
+# Measure function. Run a case until max_runs or the time budget, then once more with tracemalloc for the peak memory.
+# Return the statistics dict of the case
+def measure(func, max_runs, budget):
+
+    consume(func())  # Warm up: caches, prepared statements, pages in the OS cache
+
+    latencies = []
+    started = time.perf_counter()
+
+    while len(latencies) < max_runs and (len(latencies) < MIN_RUNS or time.perf_counter() - started < budget):
+        start = time.perf_counter()
+        consume(func())
+        latencies.append(time.perf_counter() - start)
+
+    total = sum(latencies)
+
+    gc.collect()
+    tracemalloc.start()
+    consume(func())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+
+    return {
+        'runs': len(latencies),
+        'mean_ms': total / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'ops_per_sec': len(latencies) / total if total else 0.0,
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+# -- CASES --
+
+# Build the cases: a list of (name, function without arguments). The arguments are random but always the same for a seed.
+# end: last day of the seeded sales (excluded)
+def build_cases(db, logic, seed=0, end=DEFAULT_END):
+
+    rng = random.Random(seed + 1)
+
+    product_columns = db.get_product_columns_db().fetchall()
+    product_names = [row[1] for row in product_columns]
+    product_ids = [row[0] for row in product_columns]
+    product_prices = {row[1]: row[2] for row in product_columns}
+    categories = db.get_categories_db().fetchall()
+    clients = [row[1] for row in db.get_clients_db()]
+
+    def product_name():
+        return rng.choice(product_names)
+
+    def product_id():
+        return rng.choice(product_ids)
+
+    def category_id():
+        return rng.choice(categories)[0]
+
+    def category_name():
+        return rng.choice(categories)[1]
+
+    def client_name():
+        return rng.choice(clients)
+
+    # A word and a prefix of a product name, for the searches
+    def name_word():
+        return rng.choice(product_name().split())
+
+    def name_prefix():
+        return product_name()[:rng.randint(3, 8)]
+
+    # The last year and the last day of the seeded sales
+    end = datetime.strptime(str(end)[:10], '%Y-%m-%d')
+    year_ago = (end - timedelta(days=365)).strftime('%Y-%m-%d')
+    last_day = (end - timedelta(days=1)).strftime('%Y-%m-%d')
+    end_day = end.strftime('%Y-%m-%d')
+
+    def sale():
+        return {
+            'product_name': product_name(),
+            'client_name': client_name(),
+            'quantity': 1,
+            'discount': 0,
+            'payment_method': 'Cash',
+        }
+
+    # The last 1000 sales, for the snapshot refresh
+    last_sale_id = db.run_query('SELECT COALESCE(MAX(id), 0) FROM sales').fetchone()[0]
+    recent_sales_id = max(last_sale_id - 1000, 0)
+
+    # Write cases that leave the data as they found it
+    def add_and_delete_category():
+        db.insert_category_db('Benchmark category')
+        db.delete_category_db('Benchmark category')
+
+    def add_and_delete_product():
+        db.insert_product_db('Benchmark product', 1.0, 10, category_id())
+        db.delete_product_db('Benchmark product')
+
+    def add_and_delete_products_bulk():
+        names = ['Benchmark product {}'.format(number) for number in range(100)]
+        db.insert_products_bulk([(name, 1.0, 10, category_id()) for name in names])
+
+        with db.transaction():
+            for name in names:
+                db.delete_product_db(name)
+
+    def rename_product():
+        name = product_name()
+        db.update_product_db('Benchmark product', product_prices[name], name)
+        db.update_product_db(name, product_prices[name], 'Benchmark product')
+
+    def add_and_delete_supplier():
+        db.insert_supplier_db('Benchmark supplier', '000000000')
+        db.delete_supplier_db('Benchmark supplier')
+
+    def add_and_delete_client():
+        db.insert_client_db('Benchmark client', 'benchmark@example.com', '')
+        db.delete_client_db('Benchmark client')
+
+    cases = [
+        # DatabaseManager: products
+        ('db.get_products_db', lambda: db.get_products_db()),
+        ('db.search_product_db', lambda: db.search_product_db(product_name())),
+        ('db.search_products_fts_db', lambda: db.search_products_fts_db('"{}"*'.format(name_word()), 50)),
+        ('db.get_product_names_db', lambda: db.get_product_names_db()),
+        ('db.get_products_by_names_db', lambda: db.get_products_by_names_db([product_name() for _ in range(50)])),
+        ('db.get_products_by_category_db', lambda: db.get_products_by_category_db(category_id())),
+        ('db.get_active_products_db', lambda: db.get_active_products_db()),
+        ('db.get_active_products_by_category_db', lambda: db.get_active_products_by_category_db(category_id())),
+        ('db.get_products_page_db', lambda: db.get_products_page_db(100, after_name=product_name())),
+        ('db.count_products_db', lambda: db.count_products_db(category_id(), only_active=True)),
+        ('db.get_product_columns_db', lambda: db.get_product_columns_db()),
+        ('db.insert_and_delete_product_db', add_and_delete_product),
+        ('db.insert_and_delete_products_bulk', add_and_delete_products_bulk),
+        ('db.update_product_db', rename_product),
+
+        # DatabaseManager: categories, suppliers and clients
+        ('db.get_categories_db', lambda: db.get_categories_db()),
+        ('db.get_category_id_by_name_db', lambda: db.get_category_id_by_name_db(category_name())),
+        ('db.get_suppliers_db', lambda: db.get_suppliers_db()),
+        ('db.get_clients_db', lambda: db.get_clients_db()),
+        ('db.get_client_id_by_name_db', lambda: db.get_client_id_by_name_db(client_name())),
+        ('db.insert_and_delete_category_db', add_and_delete_category),
+        ('db.insert_and_delete_supplier_db', add_and_delete_supplier),
+        ('db.insert_and_delete_client_db', add_and_delete_client),
+
+        # DatabaseManager: stock
+        ('db.update_product_stock_db', lambda: db.update_product_stock_db(product_id(), rng.randint(500000, 1000000))),
+        ('db.decrement_product_stock_db', lambda: db.decrement_product_stock_db(product_id(), 1)),
+        ('db.increment_product_stock_db', lambda: db.increment_product_stock_db(product_id(), 1)),
+        ('db.decrement_products_stock_bulk_db', lambda: db.decrement_products_stock_bulk_db([(product_id(), 1) for _ in range(50)])),
+        ('db.get_stock_movements_db', lambda: db.get_stock_movements_db(product_id())),
+        ('db.get_stock_as_of_db', lambda: db.get_stock_as_of_db(year_ago, product_id())),
+        ('db.create_stock_snapshot_db', lambda: db.create_stock_snapshot_db()),
+
+        # DatabaseManager: sales reads
+        ('db.get_sales_report_page_db', lambda: db.get_sales_report_page_db(100)),
+        ('db.get_sales_report_db', lambda: db.get_sales_report_db()),
+        ('db.get_sales_by_category_db', lambda: db.get_sales_by_category_db()),
+        ('db.get_sales_summary_db.day', lambda: db.get_sales_summary_db(year_ago, end_day, 'product', 'day')),
+        ('db.get_sales_summary_db.raw', lambda: db.get_sales_summary_db(last_day, end_day, 'product')),
+        ('db.get_daily_sales_db', lambda: db.get_daily_sales_db(year_ago, end_day)),
+        ('db.get_sales_years_db', lambda: db.get_sales_years_db()),
+        ('db.get_sales_since_db', lambda: db.get_sales_since_db(recent_sales_id)),
+        ('db.rebuild_category_sales_totals_db', lambda: db.rebuild_category_sales_totals_db()),
+        ('db.rebuild_sales_rollups_db', lambda: db.rebuild_sales_rollups_db()),
+
+        # DatabaseManager: sales writes, after the reads so they dont grow the tables the reads measure
+        ('db.insert_sales_db', lambda: db.insert_sales_db(product_id(), 1, 1, 10.0, 'Cash')),
+        ('db.insert_sales_bulk_db', lambda: db.insert_sales_bulk_db([(product_id(), 1, 1, 10.0, 'Cash', None) for _ in range(100)])),
+
+        # ProductLogic hot paths
+        ('logic.process_sale', lambda: logic.process_sale(product_name(), client_name(), 1, 0, 'Cash')),
+        ('logic.process_sales_batch', lambda: logic.process_sales_batch([sale() for _ in range(50)])),
+        ('logic.manual_update_stock', lambda: logic.manual_update_stock(product_name(), rng.randint(500000, 1000000))),
+        ('logic.filter_products', lambda: logic.filter_products(category_name(), False)),
+        ('logic.filter_products.page', lambda: logic.filter_products(category_name(), True, limit=100)),
+        ('logic.search_products', lambda: logic.search_products(name_word())),
+        ('logic.suggest_products', lambda: logic.suggest_products(name_prefix())),
+        ('logic.get_sales_report', lambda: logic.get_sales_report()),
+        ('logic.get_sales_report_page', lambda: logic.get_sales_report_page(100)),
+        ('logic.update_dashboard', lambda: logic.get_sales_by_category()),
+        ('logic.get_sales_summary', lambda: logic.get_sales_summary(year_ago, end, 'category')),
+    ]
+
+    return cases
+
+
+# -- BASELINE --
+
+# Compare function. Return the cases whose p50 or p95 grew more than threshold over the baseline, as
+# (name, metric, baseline_ms, current_ms, ratio) tuples
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+
+    regressions = []
+
+    for name, current in results['cases'].items():
+        previous = baseline.get('cases', {}).get(name)
+
+        if previous is None:
+            continue
+
+        for metric in ('p50_ms', 'p95_ms'):
+            if previous[metric] > 0 and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append((name, metric, previous[metric], current[metric], current[metric] / previous[metric]))
+
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark of the DatabaseManager methods and the ProductLogic hot paths.')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small', help='Number of sales: small 10k, medium 1M, large 10M')
+    parser.add_argument('--rows', type=int, help='Number of sales (overrides --size)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the data and the arguments (default 0)')
+    parser.add_argument('--end', default=DEFAULT_END, help='Last day of the seeded sales, excluded (default {})'.format(DEFAULT_END))
+    parser.add_argument('--db', help='Database file. It is seeded if it doesnt exist and kept, so the next runs reuse it')
+    parser.add_argument('--profile', default='balanced', help='DatabaseManager profile used by the cases (default balanced)')
+    parser.add_argument('--runs', type=int, default=200, help='Maximum runs of every case (default 200)')
+    parser.add_argument('--budget', type=float, default=2.0, help='Seconds per case before it stops repeating (default 2)')
+    parser.add_argument('--only', help='Run only the cases whose name contains this text')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON of a previous run. Exit with code 1 if a case is slower')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed slowdown over the baseline (default 0.25)')
+    args = parser.parse_args()
+
+    sales = args.rows if args.rows is not None else SIZES[args.size]
+    temp_folder = None
+
+    if args.db:
+        db_path = args.db
+    else:
+        temp_folder = tempfile.mkdtemp(prefix='inventory_bench_')
+        db_path = os.path.join(temp_folder, 'bench.db')
+
+    try:
+        if not os.path.exists(db_path):
+            print('Seeding {} sales...'.format(sales))
+            start = time.perf_counter()
+
+            seed_db = DatabaseManager(db_path, profile='bulk-load')
+            seed_database(seed_db, sales, args.seed, args.end)
+            seed_db.close()
+
+            print('Seeded in {:.1f} s'.format(time.perf_counter() - start))
+
+        db = DatabaseManager(db_path, profile=args.profile)
+        logic = ProductLogic(db)
+
+        products = db.run_query('SELECT COUNT(*) FROM products').fetchone()[0]
+        sales = db.run_query('SELECT COUNT(*) FROM sales').fetchone()[0]
+
+        results = {
+            'meta': {
+                'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'sales': sales,
+                'products': products,
+                'seed': args.seed,
+                'end': args.end,
+                'profile': args.profile,
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+            },
+            'cases': {},
+        }
+
+        print('{:<40} {:>6} {:>10} {:>10} {:>10} {:>11} {:>10}'.format('Case', 'Runs', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'Ops/s', 'Peak (KB)'))
+
+        for name, func in build_cases(db, logic, args.seed, args.end):
+
+            if args.only and args.only not in name:
+                continue
+
+            stats = measure(func, args.runs, args.budget)
+            results['cases'][name] = stats
+
+            print('{:<40} {:>6} {:>10.3f} {:>10.3f} {:>10.3f} {:>11.1f} {:>10.1f}'.format(
+                name, stats['runs'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['ops_per_sec'], stats['peak_memory_kb']
+            ))
+
+        logic.close()
+        db.close()
+
+    finally:
+        if temp_folder:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+
+        regressions = compare(results, baseline, args.threshold)
+
+        if regressions:
+            print('\nRegressions over {} (threshold {:.0%}):'.format(args.baseline, args.threshold))
+            for name, metric, previous, current, ratio in regressions:
+                print('  {:<40} {:<7} {:>10.3f} -> {:>10.3f} ms  (x{:.2f})'.format(name, metric, previous, current, ratio))
+            sys.exit(1)
+
+        print('\nNo regressions over {}.'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ import sqlite3
 # MODULE IMPORTS
 from modules.database_manager import DatabaseManager
 from modules.product_logic import ProductLogic
+from modules.db_executor import DatabaseExecutor
 from modules.ui_components import ProductForm, ProductTree, SearchForm, CategoryManagerWindow, SupplierManagerWindow, SalesPanel, DashboardPanel, ClientManagerWindow, SalesReportWindow
 
 # PRODUCTS CLASS
@@ -35,6 +36,9 @@ class Products:
         # Use the bussiness logic
         self.logic = ProductLogic(self.db)
 
+        # Background executor. The slow database work runs in worker threads so the window never freezes
+        self.executor = DatabaseExecutor(self.wind, on_busy_change=self.set_busy, on_task_error=self.show_task_error)
+
         # Styles
         style = ttk.Style()
         style.theme_use('alt')
@@ -71,6 +75,10 @@ class Products:
         self.message = Label(left_frame, text='', fg='red')
         self.message.pack(pady=5)
 
+        # Busy indicator (database work running in the background)
+        self.busy_label = Label(left_frame, text='', fg='blue')
+        self.busy_label.pack()
+
         # 3. Checkbutton Widget (Filter)
         self.filters_frame = LabelFrame(left_frame, text='Filters')
         self.filters_frame.pack(fill=X, padx=5, pady=5)
@@ -127,6 +135,9 @@ class Products:
         # Search Button
         self.search_panel.btn_search.config(command=self.search_product)
 
+        # Search as you type
+        self.search_panel.set_incremental_search(self.incremental_search)
+
         # Reset Button to see all again
         self.search_panel.btn_reset.config(command=self.get_products)
 
@@ -161,41 +172,78 @@ class Products:
         # Load the Filter Combobox with data
         self.load_filter_categories()
 
+        # Save the daily stock snapshot
+        self.schedule_stock_snapshot()
+
     # -- CONTROLLERS: CONNECTING UI EVENTS TO THE BUSSINESS LOGIC --
 
+    # Busy indicator function. Called by the executor when the background work starts or ends
+    def set_busy(self, busy):
+
+        self.busy_label['text'] = 'Working...' if busy else ''
+        self.wind.config(cursor='watch' if busy else '')
+
+    # Task error function. Called by the executor when a background task without its own error handler fails
+    def show_task_error(self, error):
+
+        self.message['text'] = 'Database error: {}'.format(error)
+        self.dashboard.add_log('Background task failed: {}'.format(error))
+
     # Search products function
     def search_product(self):
 
         # Get the text from the SearchForm component
         search_term = self.search_panel.get_search_term()
 
-        # Use the logic with the terms found in the UI
-        db_rows = self.logic.search_product(search_term)
+        # Use the logic with the terms found in the UI (ranked full text search), in the background.
+        # The key 'products' makes the newest search or filter win over the older ones
+        self.executor.submit(self.logic.search_products, search_term, key='products', on_done=lambda db_rows: self.show_search_results(db_rows, search_term))
+
+    # Function to show the search results in the table
+    def show_search_results(self, db_rows, search_term):
 
-        # Clean table
+        # Clean table (search results are not paged)
+        self.tree.stop_virtual()
         self.tree.clean_rows()
 
         # Filling data
-        try:
-            for row in db_rows:
-                self.tree.add_row(row[1],row[2])
-        except TypeError as te:
+        self.tree.insert_product_rows(db_rows)
+
+        if not db_rows:
             self.message['text'] = 'No products found matching {}'.format(search_term)
 
+    # Incremental search function. Called by the SearchForm when the user stops typing
+    def incremental_search(self, search_term):
+
+        # Empty search: show all the products again
+        if not search_term.strip():
+            self.get_products()
+            return
+
+        # The names are answered from memory, only the visible matches are read from the database
+        self.executor.submit(self.logic.suggest_products, search_term, 50, key='products', on_done=lambda db_rows: self.show_search_results(db_rows, search_term))
+
     # Get products function:
     def get_products(self):
         
-        # Clean visual table
-        self.tree.clean_rows()
+        self.load_products('All', 0)
+
+    # Function to load the products of a filter in the table.
+    # Virtual table: it only asks the logic for the page of products the user is looking at. The first page is read in the background
+    def load_products(self, category, only_active):
 
-        # Ask for the logic data
-        db_rows = self.logic.get_products()
+        loader = self.product_page_loader(category, only_active)
 
-        # Fill the table with data using their own method add_rows()
-        for row in db_rows:
+        self.executor.submit(loader, None, None, self.tree.page_size, key='products', on_done=lambda rows: self.tree.load_virtual(loader, rows))
 
-            category_id = row[5] if len(row) > 5 else 1
-            self.tree.add_row(name=row[1], price=row[2], stock=row[3], category_id=category_id)
+    # Function to create the page loader used by the virtual ProductTree for a filter
+    def product_page_loader(self, category, only_active):
+
+        def loader(after_name, before_name, limit):
+            rows, total, next_after_name = self.logic.filter_products(category, only_active, limit, after_name, before_name)
+            return rows
+
+        return loader
     
     # Add product function
     def add_product(self):
@@ -341,15 +389,26 @@ class Products:
             return
 
 
-        # 3. Process sale through logic
-        success, message = self.logic.process_sale(
+        # 3. Process sale through logic, in the background. The button is disabled until it ends to avoid double sales
+        self.sales_panel.btn_sell.config(state=DISABLED)
+
+        self.executor.submit(
+            self.logic.process_sale,
             product_name=product_name,
             client_name=client_name, 
             quantity=quantity,
             discount_percent=discount,
-            payment_method=payment_method
+            payment_method=payment_method,
+            on_done=lambda result: self.sale_finished(result, product_name, quantity),
+            on_error=lambda error: self.sale_finished((False, f"Error processing sale: {error}"), product_name, quantity)
         )
 
+    # Function called in the main thread when a sale has been processed
+    def sale_finished(self, result, product_name, quantity):
+
+        success, message = result
+        self.sales_panel.btn_sell.config(state=NORMAL)
+
         # 4. Update UI.
         if success:
             self.sales_panel.set_message(message, 'green')
@@ -371,13 +430,10 @@ class Products:
     # Function to refresh products in Sales Panel OptionMenu
     def refresh_sales_products(self):
 
-        # 1. Get all the products from the logic layer
-        products_data = self.logic.get_products().fetchall()
+        # 1. Get only the names of the products from the logic layer
+        product_names = self.logic.get_product_names()
 
-        # 2. Extract only the names
-        product_names = [row[1] for row in products_data]
-
-        # 3. Pass the lista of names to the SalesPanel component
+        # 2. Pass the lista of names to the SalesPanel component
         self.sales_panel.load_products(product_names)
 
 
@@ -462,6 +518,9 @@ class Products:
         menubar.add_cascade(label='Management', menu=management_menu)
         
         reports_menu.add_command(label='Sales History', command=self.open_sales_report)
+        reports_menu.add_command(label='Rebuild Dashboard Totals', command=self.rebuild_sales_totals)
+        reports_menu.add_command(label='Archive Old Sales', command=self.archive_sales)
+        reports_menu.add_command(label='Export Analytics Snapshot', command=self.export_sales_snapshot)
         menubar.add_cascade(label='Reports', menu=reports_menu)
 
         menubar.add_command(label='Help', command=lambda: messagebox.showinfo("Help", "Inventory System"))
@@ -570,15 +629,8 @@ class Products:
         category = self.filter_category_combo.get()
         only_active = self.show_active_var.get()
 
-        # 2. Call the logic
-        db_rows = self.logic.filter_products(category, only_active)
-
-        # 3. Update table
-        self.tree.clean_rows()
-        
-        for row in db_rows:
-            category_id = row[5] if len(row) > 5 else 1
-            self.tree.add_row(name=row[1], price=row[2], stock=row[3], category_id=category_id)
+        # 2. Update table. The logic is called page by page while the user scrolls
+        self.load_products(category, only_active)
 
 
     # Function to reset filters
@@ -666,13 +718,43 @@ class Products:
     # Function to fetch and update the Dashboard visuals
     def update_dashboard(self):
 
-        # Get sales data from the logic layer
-        sales_data = self.logic.get_sales_by_category()
-
-        # Get data to the Dashboard component for drawing
-        self.dashboard.draw_sales_graph(sales_data)
+        # Get sales data from the logic layer (in the background) and give it to the Dashboard component for drawing
+        self.executor.submit(self.logic.get_sales_by_category, key='dashboard', on_done=self.dashboard.draw_sales_graph)
 
     
+    # Function to recalculate the dashboard totals from all the sales (in the background, it reads every sale)
+    def rebuild_sales_totals(self):
+
+        def show_result(result):
+            success, message = result
+
+            self.dashboard.add_log(message)
+
+            if success:
+                self.update_dashboard()
+
+        self.executor.submit(self.logic.rebuild_sales_totals, key='rebuild_sales_totals', on_done=show_result)
+
+    # Function to move the sales of the closed years to the yearly archive files (in the background, it can take a while)
+    def archive_sales(self):
+
+        if not messagebox.askyesno('Archive old sales', 'Move the sales of the previous years to the archive files?'):
+            return
+
+        self.executor.submit(self.logic.archive_sales, key='archive_sales', on_done=lambda result: self.dashboard.add_log(result[1]))
+
+    # Function to append the new sales to the columnar snapshot read by the analytics processes (in the background)
+    def export_sales_snapshot(self):
+
+        self.executor.submit(self.logic.export_sales_snapshot, key='export_sales_snapshot', on_done=lambda result: self.dashboard.add_log(result[1]))
+
+    # Function to save the stock snapshot in the background. It checks again every hour, but a new snapshot is only
+    # saved when the last one is one day old
+    def schedule_stock_snapshot(self):
+
+        self.executor.submit(self.logic.snapshot_stock, key='stock_snapshot')
+        self.wind.after(3600000, self.schedule_stock_snapshot)
+
     # -- CLIENTS -- 
     def manage_clients(self):
 
@@ -756,14 +838,23 @@ class Products:
         # Create Window
         report_window = SalesReportWindow(self.wind)
 
-        # Get data from Logic
-        sales_data = self.logic.get_sales_report()
+        # Load data into UI. Only the first page is read now (in the background), the rest while the user scrolls
+        page_loader = lambda cursor, limit: self.logic.get_sales_report_page(limit, cursor)
 
-        # Load data into UI
-        report_window.load_data(sales_data)
+        def show_first_page(first_page):
+            # The user could have closed the window meanwhile
+            if report_window.winfo_exists():
+                report_window.load_pages(page_loader, first_page)
+
+        self.executor.submit(page_loader, None, report_window.page_size, key='sales_report', on_done=show_first_page)
                                              
 # Main Execution Block
 if __name__ == '__main__':
     window = Tk()
     application = Products(window)
-    window.mainloop()
\ No newline at end of file
+    window.mainloop()
+
+    # Wait for the background work and release the pooled database connections on exit
+    application.executor.shutdown()
+    application.logic.close()
+    application.db.close()
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+In this script only include the sales analytics. The data is read once into NumPy arrays (one array per column) and every
+metric is calculated with vectorized operations over the whole catalogue, without Python loops per row
+"""
+
+from datetime import date
+
+import numpy as np
+
+
+# Cumulative revenue share where the classes A and B end (Pareto): A = first 80% of the revenue, B = next 15%, C = the rest
+ABC_THRESHOLDS = (0.80, 0.95)
+
+# Rows read from the database in every fetchmany
+FETCH_CHUNK_SIZE = 100000
+
+
+# Read a cursor into one NumPy array per column. dtypes: the dtype of every column
+def fetch_columns(cursor, dtypes, chunk_size=FETCH_CHUNK_SIZE):
+
+    chunks = [[] for _ in dtypes]
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+
+        if not rows:
+            break
+
+        # zip(*rows) turns the chunk into columns in C, every column becomes an array at once
+        for chunk, column, dtype in zip(chunks, zip(*rows), dtypes):
+            chunk.append(np.asarray(column, dtype=dtype))
+
+    return [np.concatenate(chunk) if chunk else np.empty(0, dtype=dtype) for chunk, dtype in zip(chunks, dtypes)]
+
+
+# ABC classification. Return an array of 'A', 'B' or 'C' for every revenue value.
+# The products are sorted by revenue and each one takes the class of the cumulative share reached before it,
+# so the product that crosses 80% is still an A. Products without revenue are always C
+def abc_classes(revenue, thresholds=ABC_THRESHOLDS):
+
+    revenue = np.asarray(revenue, dtype=np.float64)
+    classes = np.full(revenue.shape, 'C', dtype='<U1')
+    total = revenue.sum()
+
+    if total <= 0:
+        return classes
+
+    order = np.argsort(-revenue, kind='stable')
+    share_before = (np.cumsum(revenue[order]) - revenue[order]) / total
+
+    sorted_classes = np.where(share_before < thresholds[0], 'A', np.where(share_before < thresholds[1], 'B', 'C'))
+    sorted_classes[revenue[order] <= 0] = 'C'
+
+    classes[order] = sorted_classes
+
+    return classes
+
+
+# Divide two arrays returning fill where the divisor is 0
+def safe_divide(numerator, denominator, fill=0.0):
+
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+
+    result = np.full(np.broadcast(numerator, denominator).shape, fill, dtype=np.float64)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+
+    return result
+
+
+# SALES ANALYTICS
+# The sales are read from the daily rollup (one row per product, day and payment method), so 10M sales of a year become
+# a few hundred thousand rows before they reach Python. Every metric is an array aligned with the products array.
+class SalesAnalytics:
+
+    # Constructor
+    def __init__(self, db_manager):
+        self.db = db_manager
+
+    # Load products function. Return the product columns: id, name, price, stock, category_id (ordered by id)
+    def load_products(self):
+
+        cursor = self.db.get_product_columns_db()
+        ids, names, prices, stock, categories = fetch_columns(cursor, (np.int64, object, np.float64, np.int64, np.int64))
+
+        return {'id': ids, 'name': names, 'price': prices, 'stock': stock, 'category_id': categories}
+
+    # Load sales function. Return the daily sales columns between start (included) and end (excluded), both 'YYYY-MM-DD':
+    # day (days since start), product_id, units, revenue
+    def load_sales(self, start, end):
+
+        cursor = self.db.get_daily_sales_db(start, end)
+        days, product_ids, units, revenue = fetch_columns(cursor, (np.int64, np.int64, np.int64, np.float64))
+
+        return {'day': days, 'product_id': product_ids, 'units': units, 'revenue': revenue}
+
+    # Analyze function. Calculate the metrics of every product between start and end (dates or 'YYYY-MM-DD', end excluded).
+    # Return a dict of arrays aligned with the products:
+    # id, name, price, stock, category_id, units, revenue, sales_days (days with sales), velocity (units per day),
+    # average_price, discount (average discount over the list price), sell_through (units / (units + stock)),
+    # days_of_cover (days the stock lasts at the current velocity, inf if it doesnt sell), days_since_last_sale
+    # (-1 if it didnt sell), revenue_share, abc ('A', 'B' or 'C')
+    def analyze(self, start, end):
+
+        start, end = date.fromisoformat(str(start)[:10]), date.fromisoformat(str(end)[:10])
+        window_days = max((end - start).days, 1)
+
+        products = self.load_products()
+        sales = self.load_sales(start.isoformat(), end.isoformat())
+
+        count = len(products['id'])
+
+        # Position of every sale in the products arrays (the ids are sorted). Sales of deleted products are dropped
+        if count:
+            index = np.clip(np.searchsorted(products['id'], sales['product_id']), 0, count - 1)
+            known = products['id'][index] == sales['product_id']
+        else:
+            index = np.zeros(len(sales['product_id']), dtype=np.int64)
+            known = np.zeros(len(index), dtype=bool)
+
+        index = index[known]
+        days = sales['day'][known]
+
+        units = np.bincount(index, weights=sales['units'][known], minlength=count)
+        revenue = np.bincount(index, weights=sales['revenue'][known], minlength=count)
+
+        # Days with sales: the rollup has one row per payment method, so the (product, day) pairs are counted once
+        pairs = np.unique(index * window_days + days)
+        sales_days = np.bincount(pairs // window_days, minlength=count)
+
+        last_day = np.full(count, -1, dtype=np.int64)
+        np.maximum.at(last_day, index, days)
+
+        stock = products['stock'].astype(np.float64)
+        velocity = units / window_days
+
+        days_of_cover = safe_divide(stock, velocity, fill=np.inf)
+        days_of_cover[stock <= 0] = 0.0
+
+        average_price = safe_divide(revenue, units)
+        discount = np.where(units > 0, 1 - safe_divide(average_price, products['price'], fill=1.0), 0.0)
+
+        total_revenue = revenue.sum()
+
+        result = dict(products)
+        result.update({
+            'units': units.astype(np.int64),
+            'revenue': revenue,
+            'sales_days': sales_days,
+            'velocity': velocity,
+            'average_price': average_price,
+            'discount': discount,
+            'sell_through': safe_divide(units, units + np.maximum(stock, 0)),
+            'days_of_cover': days_of_cover,
+            'days_since_last_sale': np.where(last_day >= 0, window_days - 1 - last_day, -1),
+            'revenue_share': revenue / total_revenue if total_revenue > 0 else np.zeros(count),
+            'abc': abc_classes(revenue),
+        })
+
+        return result
+
+    # Summary by class function. Return {class: (products, units, revenue)} for A, B and C
+    def summary_by_class(self, result):
+
+        summary = {}
+
+        for abc_class in ('A', 'B', 'C'):
+            mask = result['abc'] == abc_class
+            summary[abc_class] = (int(mask.sum()), int(result['units'][mask].sum()), float(result['revenue'][mask].sum()))
+
+        return summary
+
+    # Top rows function. Return the products as (name, units, revenue, velocity, days_of_cover, abc) tuples, ordered by a
+    # metric (highest first), at most limit
+    def top_rows(self, result, order_by='revenue', limit=50):
+
+        order = np.argsort(-result[order_by], kind='stable')[:limit]
+
+        return list(zip(
+            result['name'][order].tolist(),
+            result['units'][order].tolist(),
+            result['revenue'][order].tolist(),
+            result['velocity'][order].tolist(),
+            result['days_of_cover'][order].tolist(),
+            result['abc'][order].tolist(),
+        ))
@@ -0,0 +1,226 @@
+"""
+In this script only include the asyncio facade over the bussiness logic
+"""
+
+import asyncio
+import queue
+import sqlite3
+import threading
+
+from modules.product_logic import ProductLogic
+
+
+# Operations that write in the database. They all run in the single writer thread, one after the other,
+# so the tills never fight for the SQLite write lock. Any other ProductLogic operation is a read.
+WRITE_OPERATIONS = {
+    'add_product',
+    'import_products',
+    'delete_product',
+    'update_product',
+    'manual_update_stock',
+    'return_product',
+    'snapshot_stock',
+    'add_category',
+    'delete_category',
+    'add_supplier',
+    'delete_supplier',
+    'add_client',
+    'delete_client',
+    'process_sale',
+    'process_sales_batch',
+    'rebuild_sales_totals',
+    'archive_sales',
+    'export_sales_snapshot',
+}
+
+# Sentinel to stop the worker threads
+_STOP = object()
+
+
+# DB LANE
+# A group of threads that take jobs from the same queue. The semaphore limits the jobs waiting or running in the lane:
+# when it is full, the callers wait (asynchronously) instead of filling the memory with requests (backpressure)
+class _Lane:
+
+    def __init__(self, name, workers, max_queue, logic):
+        self.name = name
+        self.logic = logic
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.jobs = queue.Queue()
+        self.slots = asyncio.Semaphore(max_queue)
+        self.threads = [threading.Thread(target=self._work, name='{}-{}'.format(name, i), daemon=True) for i in range(workers)]
+
+        for thread in self.threads:
+            thread.start()
+
+    # Worker thread loop
+    def _work(self):
+
+        try:
+            while True:
+                job = self.jobs.get()
+
+                if job is _STOP:
+                    return
+
+                loop, future, func, args, kwargs = job
+
+                # The caller was cancelled before the job started
+                if future.cancelled():
+                    loop.call_soon_threadsafe(self._release)
+                    continue
+
+                try:
+                    result = func(*args, **kwargs)
+
+                    # Cursors can only be read in the thread that owns the connection
+                    if isinstance(result, sqlite3.Cursor):
+                        result = result.fetchall()
+
+                except Exception as e:
+                    loop.call_soon_threadsafe(self._finish, future, None, e)
+
+                else:
+                    loop.call_soon_threadsafe(self._finish, future, result, None)
+
+        finally:
+            # Every thread has its own pooled connection
+            self.logic.db.release_connection()
+
+    # Event loop side: free the slot
+    def _release(self):
+
+        self.in_flight -= 1
+        self.slots.release()
+
+    # Event loop side: set the result and free the slot
+    def _finish(self, future, result, error):
+
+        self._release()
+
+        if future.cancelled():
+            return
+
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    # Run a function in the lane and wait for its result
+    async def run(self, func, *args, **kwargs):
+
+        await self.slots.acquire()
+        self.in_flight += 1
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        self.jobs.put((loop, future, func, args, kwargs))
+
+        return await future
+
+    # Number of jobs waiting or running
+    def pending(self):
+
+        return self.in_flight
+
+    # Stop the threads after the jobs already queued
+    def stop(self):
+
+        for _ in self.threads:
+            self.jobs.put(_STOP)
+
+    def join(self):
+
+        for thread in self.threads:
+            thread.join()
+
+
+# ASYNC PRODUCT LOGIC
+# Same operations as ProductLogic, but as coroutines: "await logic.process_sale(...)".
+# Writes go to one writer thread and reads to a pool of reader threads (SQLite in WAL mode lets them read while the writer works).
+# All the calls must come from the same event loop.
+class AsyncProductLogic:
+
+    # Constructor. logic: a ProductLogic or a DatabaseManager (a ProductLogic is created for it)
+    def __init__(self, logic, readers=4, max_queue=100):
+
+        self.logic = logic if isinstance(logic, ProductLogic) else ProductLogic(logic)
+        self._owns_logic = self.logic is not logic
+
+        self._writer = _Lane('db-writer', 1, max_queue, self.logic)
+        self._readers = _Lane('db-reader', readers, max_queue, self.logic)
+        self._closed = False
+
+    # Async context manager support
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    # Every ProductLogic method is available as a coroutine
+    def __getattr__(self, name):
+
+        if name.startswith('_') or name == 'logic':
+            raise AttributeError(name)
+
+        func = getattr(self.logic, name)
+
+        if not callable(func):
+            raise AttributeError(name)
+
+        lane = self._writer if name in WRITE_OPERATIONS else self._readers
+
+        async def operation(*args, **kwargs):
+
+            if self._closed:
+                raise RuntimeError('AsyncProductLogic is closed.')
+
+            return await lane.run(func, *args, **kwargs)
+
+        operation.__name__ = name
+        return operation
+
+    # Stream the sales report page by page without loading it in memory
+    async def iter_sales_report(self, page_size=1000):
+
+        cursor = None
+
+        while True:
+            rows, cursor = await self._readers.run(self.logic.get_sales_report_page, page_size, cursor)
+
+            for row in rows:
+                yield row
+
+            if cursor is None:
+                return
+
+    # Queue statistics: jobs waiting or running in each lane
+    def get_queue_stats(self):
+
+        return {
+            'writer_pending': self._writer.pending(),
+            'readers_pending': self._readers.pending(),
+            'max_queue': self._writer.max_queue,
+        }
+
+    # Close function. Finish the queued jobs and stop the threads without blocking the event loop
+    async def close(self):
+
+        if self._closed:
+            return
+
+        self._closed = True
+
+        self._writer.stop()
+        self._readers.stop()
+
+        await asyncio.to_thread(self._writer.join)
+        await asyncio.to_thread(self._readers.join)
+
+        # A ProductLogic created here is closed here too (the report worker processes)
+        if self._owns_logic:
+            await asyncio.to_thread(self.logic.close)
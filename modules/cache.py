@@ -0,0 +1,263 @@
+"""
+In this script only include in-process caches used by the bussiness logic to avoid repeated queries
+"""
+
+import threading
+from collections import OrderedDict
+
+
+# REFERENCE CACHE
+# Categories, suppliers and clients change rarely and are small, so every table is cached whole (the same rows that
+# get_*_db returns) together with a name -> id map built from them.
+# It is subscribed to DatabaseManager.add_change_listener(): any insert or delete in a table drops its entry,
+# and the next read loads it again.
+class ReferenceCache:
+
+    # Constructor. tables: names of the tables this cache is allowed to keep
+    def __init__(self, tables=('categories', 'suppliers', 'clients')):
+        self.tables = set(tables)
+
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        # Generation of every table. It changes on every invalidation, so a load that started before
+        # an invalidation is not stored (it could contain old data)
+        self._generations = {}
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # Get the cached entry of a table, loading it if needed. loader() must return the rows of the table
+    def _get_entry(self, table, loader):
+
+        with self._lock:
+            entry = self._entries.get(table)
+
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            generation = self._generations.get(table, 0)
+
+        # The query runs outside the lock, so other threads can keep reading other tables
+        rows = tuple(loader())
+        ids = {}
+
+        # If a name is repeated, the lowest ID wins (the first row the database returns for that name)
+        for row in sorted(rows, key=lambda row: row[0]):
+            ids.setdefault(row[1], row[0])
+
+        entry = {'rows': rows, 'ids': ids}
+
+        with self._lock:
+            if self._generations.get(table, 0) == generation:
+                self._entries[table] = entry
+
+        return entry
+
+    # Get rows function. Return all the rows of a table
+    def get_rows(self, table, loader):
+
+        return self._get_entry(table, loader)['rows']
+
+    # Get id function. Return the ID of a name, or None if it doesnt exist
+    def get_id(self, table, name, loader):
+
+        return self._get_entry(table, loader)['ids'].get(name)
+
+    # Get ids function. Return the whole name -> ID map of a table
+    def get_ids(self, table, loader):
+
+        return self._get_entry(table, loader)['ids']
+
+    # Invalidate function. Drop a table (or everything if table is None)
+    def invalidate(self, table=None):
+
+        with self._lock:
+            tables = list(self.tables) if table is None else [table]
+
+            for name in tables:
+                self._entries.pop(name, None)
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+            self.invalidations += 1
+
+    # Statistics function
+    def get_stats(self):
+
+        with self._lock:
+            total = self.hits + self.misses
+
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / total if total else 0.0,
+                'cached_tables': sorted(self._entries),
+            }
+
+    # Change listener for DatabaseManager.add_change_listener()
+    def on_database_change(self, table, action, data):
+
+        if table in self.tables:
+            self.invalidate(table)
+
+
+# PRODUCT CACHE
+# LRU cache of product records (ProductRecord) by name, used by the sale and stock update paths that always start looking for the same
+# few hundred best sellers. When it is full, the least recently used product is evicted.
+# It is subscribed to DatabaseManager.add_change_listener() and it is write-through for the stock: the new stock of a
+# cached product is written in its row after the commit, so a sale does not need to read it again from disk.
+# Updates (name or price) and deletes drop the product, it is loaded again on the next read.
+class ProductCache:
+
+    # Constructor. max_size: maximum number of products kept in memory
+    def __init__(self, max_size=512):
+        self.max_size = max(int(max_size), 1)
+
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()
+        self._names = {}
+
+        # It changes on every write, so a load that started before a write is not stored (it could contain old data)
+        self._generation = 0
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_throughs = 0
+
+    # Get function. Return the row of a product, or None if it doesnt exist.
+    # loader(name) must return the record from the database (or None). Products that dont exist are not cached
+    def get(self, name, loader):
+
+        with self._lock:
+            row = self._rows.get(name)
+
+            if row is not None:
+                self._rows.move_to_end(name)
+                self.hits += 1
+                return row
+
+            self.misses += 1
+            generation = self._generation
+
+        # The query runs outside the lock
+        row = loader(name)
+
+        if row is not None:
+            with self._lock:
+                if self._generation == generation:
+                    self._store(row)
+
+        return row
+
+    # Store a row as the most recently used and evict the oldest ones if the cache is full. Call it with the lock
+    def _store(self, row):
+
+        name = row.name
+
+        self._rows[name] = row
+        self._rows.move_to_end(name)
+        self._names[row.id] = name
+
+        while len(self._rows) > self.max_size:
+            old_name, old_row = self._rows.popitem(last=False)
+            self._names.pop(old_row.id, None)
+            self.evictions += 1
+
+    # Drop a product by name. Call it with the lock
+    def _drop(self, name):
+
+        row = self._rows.pop(name, None)
+
+        if row is not None:
+            self._names.pop(row.id, None)
+
+    # Write the stock of a product in its cached row. stock None drops the product. Call it with the lock
+    def _set_stock(self, product_id, stock):
+
+        name = self._names.get(product_id)
+
+        if name is None:
+            return
+
+        if stock is None:
+            self._drop(name)
+            return
+
+        # The records can be in use by other threads, so a new one replaces the old one
+        self._rows[name] = self._rows[name].replace(stock=stock)
+        self.write_throughs += 1
+
+    # Invalidate function. Drop a product by name, or everything if name is None
+    def invalidate(self, name=None):
+
+        with self._lock:
+            self._generation += 1
+
+            if name is None:
+                self._rows.clear()
+                self._names.clear()
+            else:
+                self._drop(name)
+
+    # Resize function. Change the maximum size, evicting the oldest products if needed
+    def resize(self, max_size):
+
+        with self._lock:
+            self.max_size = max(int(max_size), 1)
+
+            while len(self._rows) > self.max_size:
+                old_name, old_row = self._rows.popitem(last=False)
+                self._names.pop(old_row.id, None)
+                self.evictions += 1
+
+    # Statistics function
+    def get_stats(self):
+
+        with self._lock:
+            total = self.hits + self.misses
+
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'write_throughs': self.write_throughs,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._rows),
+                'max_size': self.max_size,
+            }
+
+    # Change listener for DatabaseManager.add_change_listener()
+    def on_database_change(self, table, action, data):
+
+        if table != 'products':
+            return
+
+        with self._lock:
+            self._generation += 1
+
+            if action == 'stock':
+
+                # New stock of every product (absolute values)
+                for product_id, stock in data.get('stock', {}).items():
+                    self._set_stock(product_id, stock)
+
+                # Units added or subtracted (relative values)
+                for product_id, delta in data.get('delta', {}).items():
+                    name = self._names.get(product_id)
+                    if name is not None:
+                        self._set_stock(product_id, self._rows[name].stock + delta)
+
+            elif action == 'update':
+                self._drop(data['old_name'])
+                self._drop(data['new_name'])
+
+            elif action == 'delete':
+                for name in data['names']:
+                    self._drop(name)
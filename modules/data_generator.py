@@ -0,0 +1,286 @@
+"""
+In this script only include the synthetic data generator for load tests and benchmarks: categories, suppliers, clients,
+products with skewed (Zipf) popularity and sales with seasonal dates. The same seed and arguments always give the same data.
+
+Run it from the project folder:
+    python -m modules.data_generator db/load_test.db --sales 10000000 --products 50000 --seed 7 --end 2026-10-01
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+
+# Names used to build the categories, products, suppliers and clients
+CATEGORY_NAMES = (
+    'Food', 'Drinks', 'Dairy', 'Bakery', 'Frozen', 'Cleaning', 'Personal care', 'Baby', 'Pets', 'Stationery',
+    'Electronics', 'Home', 'Garden', 'Toys', 'Sports', 'Clothing', 'Shoes', 'Pharmacy', 'Hardware', 'Books',
+)
+PRODUCT_ADJECTIVES = ('Organic', 'Classic', 'Premium', 'Light', 'Extra', 'Mini', 'Family', 'Fresh', 'Natural', 'Deluxe', 'Eco', 'Basic')
+PRODUCT_NOUNS = ('apple', 'coffee', 'soap', 'bread', 'milk', 'rice', 'pasta', 'juice', 'towel', 'battery', 'notebook', 'shampoo',
+                 'cookies', 'yogurt', 'cheese', 'tea', 'detergent', 'candle', 'socks', 'cable')
+FIRST_NAMES = ('Ana', 'Luis', 'Marta', 'Jorge', 'Lucia', 'Pablo', 'Sara', 'David', 'Elena', 'Carlos', 'Laura', 'Javier')
+LAST_NAMES = ('Garcia', 'Lopez', 'Martin', 'Sanchez', 'Perez', 'Gomez', 'Ruiz', 'Diaz', 'Moreno', 'Alvarez', 'Romero', 'Navarro')
+
+# Seasonality of the sales: weight of every month (January first), every weekday (Monday first) and every hour of the day
+MONTH_WEIGHTS = (0.80, 0.75, 0.90, 0.95, 1.00, 1.00, 1.05, 0.85, 0.95, 1.00, 1.20, 1.60)
+WEEKDAY_WEIGHTS = (0.90, 0.90, 0.95, 1.00, 1.15, 1.35, 0.75)
+HOUR_WEIGHTS = (0, 0, 0, 0, 0, 0, 0, 0, 0, 4, 6, 8, 10, 12, 9, 6, 6, 8, 11, 12, 9, 5, 0, 0)
+
+# Quantity, discount (%) and payment method of a sale, with their weights
+QUANTITIES = ((1, 2, 3, 4, 5), (60, 20, 10, 6, 4))
+DISCOUNTS = ((0, 5, 10, 20), (85, 8, 5, 2))
+PAYMENT_METHODS = (('Card', 'Cash', 'Transfer'), (60, 35, 5))
+
+# Sales inserted in every transaction
+DEFAULT_CHUNK_SIZE = 100000
+
+
+# Cumulative weights of a Zipf distribution for n ranks: the rank r is chosen with probability proportional to 1 / r^s
+def zipf_cum_weights(n, s):
+    return list(accumulate(1.0 / rank ** s for rank in range(1, n + 1)))
+
+
+# Split total in integer parts proportional to weights (largest remainder), so the parts always add up to total
+def allocate(total, weights):
+
+    weight_sum = sum(weights)
+    exact = [total * weight / weight_sum for weight in weights]
+    parts = [int(value) for value in exact]
+
+    remainders = sorted(range(len(weights)), key=lambda index: (parts[index] - exact[index], index))
+
+    for index in remainders[:total - sum(parts)]:
+        parts[index] += 1
+
+    return parts
+
+
+# DATA GENERATOR
+# Fill a database (usually an empty one) through the bulk paths of DatabaseManager. The sales are generated day by day in
+# date order and inserted in chunks, so the memory used depends on chunk_size, the number of products and the sales of one day,
+# not on the total number of sales.
+# - Product popularity follows a Zipf law (a few best sellers, a long tail). The best sellers are spread over the catalogue, not the first IDs.
+# - The sales of every day follow MONTH_WEIGHTS and WEEKDAY_WEIGHTS plus a yearly growth, and their hours follow HOUR_WEIGHTS.
+# - The sales are inserted directly: the stock of the products and the stock ledger are not changed by them.
+class DataGenerator:
+
+    # Constructor. end: last day of sales (excluded), today by default; give it to get the same dates every day.
+    # zipf_products / zipf_clients: skew of the popularity (0 = uniform). growth: yearly growth of the sales (0.1 = 10%)
+    def __init__(self, seed=0, categories=20, suppliers=10, clients=1000, products=1000, days=730, end=None,
+                 zipf_products=1.1, zipf_clients=0.6, growth=0.1, stock_range=(0, 500)):
+
+        self.seed = seed
+        self.categories = categories
+        self.suppliers = suppliers
+        self.clients = clients
+        self.products = products
+        self.days = max(int(days), 1)
+        self.end = date.fromisoformat(str(end)[:10]) if end else date.today()
+        self.start = self.end - timedelta(days=self.days)
+        self.zipf_products = zipf_products
+        self.zipf_clients = zipf_clients
+        self.growth = growth
+        self.stock_range = stock_range
+
+    # -- REFERENCE DATA --
+
+    def category_names(self):
+        return [CATEGORY_NAMES[number] if number < len(CATEGORY_NAMES) else 'Category {}'.format(number + 1) for number in range(self.categories)]
+
+    def product_name(self, number):
+        return '{} {} {:07d}'.format(
+            PRODUCT_ADJECTIVES[number % len(PRODUCT_ADJECTIVES)], PRODUCT_NOUNS[number // len(PRODUCT_ADJECTIVES) % len(PRODUCT_NOUNS)], number + 1
+        )
+
+    # Insert the categories, suppliers and clients whose names are not in the database yet. The random values are drawn
+    # for the existing ones too, so the rest of the data is the same on an empty or an already filled database
+    def _insert_reference_data(self, db, rng):
+
+        categories = {row[1] for row in db.get_categories_db()}
+        suppliers = {row[1] for row in db.get_suppliers_db()}
+        clients = {row[1] for row in db.get_clients_db()}
+
+        with db.transaction():
+            for name in self.category_names():
+                if name not in categories:
+                    db.insert_category_db(name)
+
+            for number in range(1, self.suppliers + 1):
+                name = 'Supplier {:03d}'.format(number)
+                phone = '600 {:03d} {:03d}'.format(rng.randrange(1000), number % 1000)
+
+                if name not in suppliers:
+                    db.insert_supplier_db(name, phone)
+
+            for number in range(1, self.clients + 1):
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                name = '{} {} {:06d}'.format(first, last, number)
+
+                if name not in clients:
+                    db.insert_client_db(name, '{}.{}{}@example.com'.format(first, last, number).lower(), '')
+
+    # Insert the products in chunks (insert_products_bulk skips the names that already exist)
+    def _insert_products(self, db, rng, chunk_size):
+
+        names = set(self.category_names())
+        category_ids = [row[0] for row in db.get_categories_db() if row[1] in names]
+        low, high = self.stock_range
+
+        for chunk_start in range(0, self.products, chunk_size):
+            rows = []
+
+            for number in range(chunk_start, min(chunk_start + chunk_size, self.products)):
+                price = round(min(rng.lognormvariate(1.8, 0.9), 999.0) + 0.5, 2)
+                rows.append((self.product_name(number), price, rng.randint(low, high), rng.choice(category_ids)))
+
+            db.insert_products_bulk(rows)
+
+    # -- SALES --
+
+    # Weight of every day between start and end: season, weekday and yearly growth
+    def day_weights(self):
+
+        weights = []
+
+        for offset in range(self.days):
+            day = self.start + timedelta(days=offset)
+            trend = (1 + self.growth) ** (offset / 365)
+            weights.append(MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()] * trend)
+
+        return weights
+
+    # Iterate the sales as rows for insert_sales_bulk_db (product_id, client_id, quantity, total, method, date), in date order.
+    # products: (id, price) of every product. client_ids: IDs of the clients
+    def iter_sales(self, sales, products, client_ids, rng):
+
+        # The popularity ranks are given to the products in a random order
+        popular_products = list(products)
+        rng.shuffle(popular_products)
+        popular_clients = list(client_ids)
+        rng.shuffle(popular_clients)
+
+        product_weights = zipf_cum_weights(len(popular_products), self.zipf_products)
+        client_weights = zipf_cum_weights(len(popular_clients), self.zipf_clients)
+        hour_weights = list(accumulate(HOUR_WEIGHTS))
+
+        quantities, quantity_weights = QUANTITIES[0], list(accumulate(QUANTITIES[1]))
+        discounts, discount_weights = DISCOUNTS[0], list(accumulate(DISCOUNTS[1]))
+        methods, method_weights = PAYMENT_METHODS[0], list(accumulate(PAYMENT_METHODS[1]))
+
+        choices = rng.choices
+
+        for offset, count in enumerate(allocate(sales, self.day_weights())):
+
+            if count == 0:
+                continue
+
+            day = datetime.combine(self.start + timedelta(days=offset), datetime.min.time())
+            seconds = sorted(hour * 3600 + rng.randrange(3600) for hour in choices(range(24), cum_weights=hour_weights, k=count))
+
+            day_products = choices(popular_products, cum_weights=product_weights, k=count)
+            day_clients = choices(popular_clients, cum_weights=client_weights, k=count)
+            day_quantities = choices(quantities, cum_weights=quantity_weights, k=count)
+            day_discounts = choices(discounts, cum_weights=discount_weights, k=count)
+            day_methods = choices(methods, cum_weights=method_weights, k=count)
+
+            for (product_id, price), client_id, quantity, discount, method, second in zip(
+                    day_products, day_clients, day_quantities, day_discounts, day_methods, seconds):
+
+                yield (
+                    product_id,
+                    client_id,
+                    quantity,
+                    round(price * quantity * (1 - discount / 100), 2),
+                    method,
+                    (day + timedelta(seconds=second)).strftime('%Y-%m-%d %H:%M:%S'),
+                )
+
+    # Generate function. Insert the reference data, the products and the sales. progress(inserted_sales) is called after every chunk.
+    # Return a dict with the number of products, clients and sales inserted
+    def generate(self, db, sales, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+
+        rng = random.Random(self.seed)
+
+        self._insert_reference_data(db, rng)
+        self._insert_products(db, rng, chunk_size)
+
+        products = [(row[0], row[2]) for row in db.get_product_columns_db()]
+        client_ids = [row[0] for row in db.get_clients_db()]
+
+        chunk = []
+        inserted = 0
+
+        for row in self.iter_sales(sales, products, client_ids, rng):
+            chunk.append(row)
+
+            if len(chunk) >= chunk_size:
+                with db.transaction():
+                    db.insert_sales_bulk_db(chunk)
+
+                inserted += len(chunk)
+                chunk = []
+
+                if progress:
+                    progress(inserted)
+
+        if chunk:
+            with db.transaction():
+                db.insert_sales_bulk_db(chunk)
+
+            inserted += len(chunk)
+
+            if progress:
+                progress(inserted)
+
+        return {'products': len(products), 'clients': len(client_ids), 'sales': inserted}
+
+
+def main():
+
+    # Allow "python modules/data_generator.py" too
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from modules.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description='Fill a database with synthetic data for load tests.')
+    parser.add_argument('database', help='Database file (created if it doesnt exist)')
+    parser.add_argument('--sales', type=int, default=100000, help='Number of sales (default 100000)')
+    parser.add_argument('--products', type=int, default=1000, help='Number of products (default 1000)')
+    parser.add_argument('--clients', type=int, default=1000, help='Number of clients (default 1000)')
+    parser.add_argument('--categories', type=int, default=20, help='Number of categories (default 20)')
+    parser.add_argument('--suppliers', type=int, default=10, help='Number of suppliers (default 10)')
+    parser.add_argument('--days', type=int, default=730, help='Days of sales before --end (default 730)')
+    parser.add_argument('--end', help='Last day of sales, excluded (YYYY-MM-DD, default today)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default 0)')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Skew of the product popularity (default 1.1, 0 = uniform)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Sales per transaction (default 100000)')
+    parser.add_argument('--profile', default='bulk-load', help='DatabaseManager profile (default bulk-load)')
+    args = parser.parse_args()
+
+    generator = DataGenerator(
+        seed=args.seed, categories=args.categories, suppliers=args.suppliers, clients=args.clients,
+        products=args.products, days=args.days, end=args.end, zipf_products=args.zipf
+    )
+
+    db = DatabaseManager(args.database, profile=args.profile)
+    start = time.perf_counter()
+
+    def progress(inserted):
+        elapsed = time.perf_counter() - start
+        print('\r{:>12} / {} sales  ({:.0f} sales/s)'.format(inserted, args.sales, inserted / elapsed if elapsed else 0), end='', flush=True)
+
+    try:
+        counts = generator.generate(db, args.sales, args.chunk_size, progress)
+    finally:
+        db.close()
+
+    print('\n{products} products, {clients} clients and {sales} sales in {elapsed:.1f} s'.format(elapsed=time.perf_counter() - start, **counts))
+
+
+if __name__ == '__main__':
+    main()
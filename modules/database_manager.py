@@ -3,39 +3,78 @@ In this script just include code related with SQLlite
 """
 import sqlite3  
 import os
+import threading
+from contextlib import contextmanager
 
-class DatabaseManager:
+from modules.records import ProductRecord, SaleRecord
 
-    # Constructor
-    def __init__(self, db_path):
-        self.db_path = db_path
 
-        self.check_db_folder()
-        self.initialize_db()
-    
-    # Check db connection
-    def check_db_folder(self):
+# SQLITE PERFORMANCE PROFILES
+# Pragmas applied to every pooled connection. cache_size is negative, so it means KiB instead of pages.
+# - durable: WAL with a full fsync on every commit. Safest option for the tills.
+# - balanced: WAL with NORMAL sync (an OS crash can only lose the last commits, never corrupt the file), bigger cache and mmap.
+# - bulk-load: no fsync at all and a very big cache. Only for imports or data generation that can be repeated if it fails.
+PERFORMANCE_PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -8000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'bulk-load': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -512000,
+        'mmap_size': 1073741824,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,
+    },
+}
 
-        # Check the 'db' folder exists
-        folder = os.path.dirname(self.db_path)
-        if not os.path.exists(folder):
-            os.makedirs(folder) # If the db not exists, create it
+DEFAULT_PROFILE = 'balanced'
 
-    # Run query function
-    def run_query(self, query, parameters=()):
+# Columns that can be used to group the sales summaries (see get_sales_summary_db)
+SALES_SUMMARY_GROUPS = {
+    None: "''",
+    'product': 'p.name',
+    'category': 'c.name',
+    'payment_method': "COALESCE(r.payment_method, '')",
+}
 
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            result = cursor.execute(query, parameters)
-            conn.commit()
-        return result
-    
+# Rollup table of every grain
+SALES_ROLLUP_TABLES = {
+    'hour': 'sales_rollup_hour',
+    'day': 'sales_rollup_day',
+}
 
-    # Initialize db
-    def initialize_db(self):
+# Environment variable to select the profile without touching the code
+PROFILE_ENV_VAR = 'INVENTORY_DB_PROFILE'
 
-        # Create all the table, if not exists, when the database initialize.
-        sql_products = '''
+
+# SCHEMA MIGRATIONS
+# Ordered list of (version, description, statements). The database version is kept in PRAGMA user_version.
+# Every statement must be idempotent (IF NOT EXISTS, OR IGNORE...) because databases created before the
+# migrations existed have version 0 but already contain the tables.
+# To change the schema, append a new migration with the next version number. Never edit an old one.
+MIGRATIONS = [
+    (1, 'Initial schema and default data', [
+        '''
+            CREATE TABLE IF NOT EXISTS categories (
+                "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+                "name" TEXT NOT NULL UNIQUE
+                )
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS products (
                 "id" INTEGER PRIMARY KEY AUTOINCREMENT,
                 "name" TEXT NOT NULL UNIQUE,
@@ -47,31 +86,23 @@ class DatabaseManager:
                 FOREIGN KEY(category_id) REFERENCES categories(id),
                 FOREIGN KEY(supplier_id) REFERENCES suppliers(id)
                 )
-            '''
-        sql_categories = '''
-            CREATE TABLE IF NOT EXISTS categories (
-                "id" INTEGER PRIMARY KEY AUTOINCREMENT,
-                "name" TEXT NOT NULL UNIQUE
-                )
-            '''
-        sql_suppliers = '''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS suppliers (
                 "id" INTEGER PRIMARY KEY AUTOINCREMENT,
                 "name" TEXT NOT NULL,
                 "phone" TEXT
                 )
-            '''
-        
-        sql_clients = """
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS clients (
                 "id" INTEGER PRIMARY KEY AUTOINCREMENT,
                 "name" TEXT NOT NULL,
                 "email" TEXT,
                 "notes" TEXT
                 )
-        """
-
-        sql_sales = """
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS sales (
                 "id" INTEGER PRIMARY KEY AUTOINCREMENT,
                 "product_id" INTEGER,
@@ -83,73 +114,926 @@ class DatabaseManager:
                 FOREIGN KEY(product_id) REFERENCES products(id),
                 FOREIGN KEY(client_id) REFERENCES clients(id)                
                 )
-        """
-        
-        self.run_query(sql_categories)
-        self.run_query(sql_products)
-        self.run_query(sql_suppliers)
-        self.run_query(sql_clients)
-        self.run_query(sql_sales)
+        ''',
 
         # DEFAULT DATA.
         # Insert a 'General' categorie and supplier to prevent errors when creating products without specifying this data yet.
+        "INSERT OR IGNORE INTO categories (id, name) VALUES (1, 'General')",
+        "INSERT OR IGNORE INTO suppliers (id, name) VALUES (1, 'Proveedor Local')",
+        "INSERT OR IGNORE INTO clients (id, name, email) VALUES (1, 'Cliente Modelo', 'cliente@correo.com')",
+    ]),
+
+    (2, 'Secondary indexes for reports, filters and name lookups', [
+        'CREATE INDEX IF NOT EXISTS idx_sales_product_id ON sales (product_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_client_id ON sales (client_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (date)',
+        'CREATE INDEX IF NOT EXISTS idx_products_category_name ON products (category_id, name)',
+        'CREATE INDEX IF NOT EXISTS idx_products_stock ON products (stock)',
+        'CREATE INDEX IF NOT EXISTS idx_clients_name ON clients (name)',
+    ]),
+
+    (3, 'Full text search index over product name and description', [
+        # External content table: the text is not duplicated, the index reads it from products
+        '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name,
+                description,
+                content='products',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='1 2 3'
+                )
+        ''',
+
+        # Triggers to keep the index in sync with every insert, delete and update of products
+        '''
+            CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+                INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+            END
+        ''',
+
+        # Index the products that already exist
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+    ]),
+
+    (4, 'Sales totals by category maintained by triggers (dashboard)', [
+        '''
+            CREATE TABLE IF NOT EXISTS category_sales_totals (
+                "category_id" INTEGER PRIMARY KEY,
+                "total_sales" REAL NOT NULL DEFAULT 0,
+                "units" INTEGER NOT NULL DEFAULT 0
+                )
+        ''',
+
+        # A new sale adds its total to the current category of the product
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_sale_insert AFTER INSERT ON sales BEGIN
+                INSERT INTO category_sales_totals (category_id, total_sales, units)
+                SELECT p.category_id, new.total_price, new.quantity FROM products p WHERE p.id = new.product_id
+                ON CONFLICT(category_id) DO UPDATE SET
+                    total_sales = total_sales + excluded.total_sales,
+                    units = units + excluded.units;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_sale_delete AFTER DELETE ON sales BEGIN
+                UPDATE category_sales_totals
+                SET total_sales = total_sales - old.total_price, units = units - old.quantity
+                WHERE category_id = (SELECT category_id FROM products WHERE id = old.product_id);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_sale_update AFTER UPDATE OF product_id, quantity, total_price ON sales BEGIN
+                UPDATE category_sales_totals
+                SET total_sales = total_sales - old.total_price, units = units - old.quantity
+                WHERE category_id = (SELECT category_id FROM products WHERE id = old.product_id);
+
+                INSERT INTO category_sales_totals (category_id, total_sales, units)
+                SELECT p.category_id, new.total_price, new.quantity FROM products p WHERE p.id = new.product_id
+                ON CONFLICT(category_id) DO UPDATE SET
+                    total_sales = total_sales + excluded.total_sales,
+                    units = units + excluded.units;
+            END
+        ''',
+
+        # The report joins sales with products, so the sales of a deleted product stop counting, and a product
+        # moved to another category takes its sales with it
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_product_delete AFTER DELETE ON products BEGIN
+                UPDATE category_sales_totals
+                SET total_sales = total_sales - (SELECT COALESCE(SUM(total_price), 0) FROM sales WHERE product_id = old.id),
+                    units = units - (SELECT COALESCE(SUM(quantity), 0) FROM sales WHERE product_id = old.id)
+                WHERE category_id = old.category_id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_product_move AFTER UPDATE OF category_id ON products BEGIN
+                UPDATE category_sales_totals
+                SET total_sales = total_sales - (SELECT COALESCE(SUM(total_price), 0) FROM sales WHERE product_id = old.id),
+                    units = units - (SELECT COALESCE(SUM(quantity), 0) FROM sales WHERE product_id = old.id)
+                WHERE category_id = old.category_id;
+
+                INSERT INTO category_sales_totals (category_id, total_sales, units)
+                SELECT new.category_id, COALESCE(SUM(total_price), 0), COALESCE(SUM(quantity), 0) FROM sales WHERE product_id = new.id
+                ON CONFLICT(category_id) DO UPDATE SET
+                    total_sales = total_sales + excluded.total_sales,
+                    units = units + excluded.units;
+            END
+        ''',
+
+        # Back-fill with the sales that already exist
+        'DELETE FROM category_sales_totals',
+        '''
+            INSERT INTO category_sales_totals (category_id, total_sales, units)
+            SELECT p.category_id, SUM(s.total_price), SUM(s.quantity)
+            FROM sales s
+            JOIN products p ON s.product_id = p.id
+            WHERE p.category_id IS NOT NULL
+            GROUP BY p.category_id
+        ''',
+    ]),
+
+    # Rollups keep one row per product and payment method for every hour / day with sales.
+    # The buckets use the same format as sales.date, so a range filter works the same way in both tables.
+    # The category is not stored: it is read from products when querying, like the rest of the reports
+    (5, 'Hourly and daily sales rollups for time range reports', [
+        '''
+            CREATE TABLE IF NOT EXISTS sales_rollup_hour (
+                "bucket" TEXT NOT NULL,
+                "product_id" INTEGER NOT NULL,
+                "payment_method" TEXT NOT NULL,
+                "sales_count" INTEGER NOT NULL DEFAULT 0,
+                "units" INTEGER NOT NULL DEFAULT 0,
+                "revenue" REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, product_id, payment_method)
+                ) WITHOUT ROWID
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS sales_rollup_hour_insert AFTER INSERT ON sales BEGIN
+                INSERT INTO sales_rollup_hour (bucket, product_id, payment_method, sales_count, units, revenue)
+                VALUES (COALESCE(strftime('%Y-%m-%d %H:00:00', new.date), ''), COALESCE(new.product_id, 0), COALESCE(new.payment_method, ''), 1, new.quantity, new.total_price)
+                ON CONFLICT(bucket, product_id, payment_method) DO UPDATE SET
+                    sales_count = sales_count + 1,
+                    units = units + excluded.units,
+                    revenue = revenue + excluded.revenue;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS sales_rollup_hour_delete AFTER DELETE ON sales BEGIN
+                UPDATE sales_rollup_hour
+                SET sales_count = sales_count - 1, units = units - old.quantity, revenue = revenue - old.total_price
+                WHERE bucket = COALESCE(strftime('%Y-%m-%d %H:00:00', old.date), '') AND product_id = COALESCE(old.product_id, 0) AND payment_method = COALESCE(old.payment_method, '');
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS sales_rollup_hour_update AFTER UPDATE OF product_id, quantity, total_price, payment_method, date ON sales BEGIN
+                UPDATE sales_rollup_hour
+                SET sales_count = sales_count - 1, units = units - old.quantity, revenue = revenue - old.total_price
+                WHERE bucket = COALESCE(strftime('%Y-%m-%d %H:00:00', old.date), '') AND product_id = COALESCE(old.product_id, 0) AND payment_method = COALESCE(old.payment_method, '');
+
+                INSERT INTO sales_rollup_hour (bucket, product_id, payment_method, sales_count, units, revenue)
+                VALUES (COALESCE(strftime('%Y-%m-%d %H:00:00', new.date), ''), COALESCE(new.product_id, 0), COALESCE(new.payment_method, ''), 1, new.quantity, new.total_price)
+                ON CONFLICT(bucket, product_id, payment_method) DO UPDATE SET
+                    sales_count = sales_count + 1,
+                    units = units + excluded.units,
+                    revenue = revenue + excluded.revenue;
+            END
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS sales_rollup_day (
+                "bucket" TEXT NOT NULL,
+                "product_id" INTEGER NOT NULL,
+                "payment_method" TEXT NOT NULL,
+                "sales_count" INTEGER NOT NULL DEFAULT 0,
+                "units" INTEGER NOT NULL DEFAULT 0,
+                "revenue" REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, product_id, payment_method)
+                ) WITHOUT ROWID
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS sales_rollup_day_insert AFTER INSERT ON sales BEGIN
+                INSERT INTO sales_rollup_day (bucket, product_id, payment_method, sales_count, units, revenue)
+                VALUES (COALESCE(strftime('%Y-%m-%d 00:00:00', new.date), ''), COALESCE(new.product_id, 0), COALESCE(new.payment_method, ''), 1, new.quantity, new.total_price)
+                ON CONFLICT(bucket, product_id, payment_method) DO UPDATE SET
+                    sales_count = sales_count + 1,
+                    units = units + excluded.units,
+                    revenue = revenue + excluded.revenue;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS sales_rollup_day_delete AFTER DELETE ON sales BEGIN
+                UPDATE sales_rollup_day
+                SET sales_count = sales_count - 1, units = units - old.quantity, revenue = revenue - old.total_price
+                WHERE bucket = COALESCE(strftime('%Y-%m-%d 00:00:00', old.date), '') AND product_id = COALESCE(old.product_id, 0) AND payment_method = COALESCE(old.payment_method, '');
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS sales_rollup_day_update AFTER UPDATE OF product_id, quantity, total_price, payment_method, date ON sales BEGIN
+                UPDATE sales_rollup_day
+                SET sales_count = sales_count - 1, units = units - old.quantity, revenue = revenue - old.total_price
+                WHERE bucket = COALESCE(strftime('%Y-%m-%d 00:00:00', old.date), '') AND product_id = COALESCE(old.product_id, 0) AND payment_method = COALESCE(old.payment_method, '');
+
+                INSERT INTO sales_rollup_day (bucket, product_id, payment_method, sales_count, units, revenue)
+                VALUES (COALESCE(strftime('%Y-%m-%d 00:00:00', new.date), ''), COALESCE(new.product_id, 0), COALESCE(new.payment_method, ''), 1, new.quantity, new.total_price)
+                ON CONFLICT(bucket, product_id, payment_method) DO UPDATE SET
+                    sales_count = sales_count + 1,
+                    units = units + excluded.units,
+                    revenue = revenue + excluded.revenue;
+            END
+        ''',
+
+        # Back-fill with the sales that already exist
+        'DELETE FROM sales_rollup_hour',
+        '''
+            INSERT INTO sales_rollup_hour (bucket, product_id, payment_method, sales_count, units, revenue)
+            SELECT COALESCE(strftime('%Y-%m-%d %H:00:00', date), ''), COALESCE(product_id, 0), COALESCE(payment_method, ''), COUNT(*), SUM(quantity), SUM(total_price)
+            FROM sales
+            GROUP BY 1, 2, 3
+        ''',
+        'DELETE FROM sales_rollup_day',
+        '''
+            INSERT INTO sales_rollup_day (bucket, product_id, payment_method, sales_count, units, revenue)
+            SELECT COALESCE(strftime('%Y-%m-%d 00:00:00', bucket), ''), product_id, payment_method, SUM(sales_count), SUM(units), SUM(revenue)
+            FROM sales_rollup_hour
+            GROUP BY 1, 2, 3
+        ''',
+    ]),
+
+    (6, 'Stock movements ledger and stock snapshots', [
+        '''
+            CREATE TABLE IF NOT EXISTS stock_movements (
+                "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+                "product_id" INTEGER NOT NULL,
+                "kind" TEXT NOT NULL CHECK (kind IN ('sale', 'adjustment', 'import', 'return')),
+                "quantity" INTEGER NOT NULL,
+                "date" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+        ''',
+
+        # The index on product_id also contains the id, so "product_id = ? AND id > ?" is a range of the index
+        'CREATE INDEX IF NOT EXISTS idx_stock_movements_product_id ON stock_movements(product_id)',
+        'CREATE INDEX IF NOT EXISTS idx_stock_movements_date ON stock_movements(date)',
+        '''
+            CREATE TABLE IF NOT EXISTS stock_snapshots (
+                "snapshot_date" TEXT NOT NULL,
+                "product_id" INTEGER NOT NULL,
+                "stock" INTEGER NOT NULL,
+                "last_movement_id" INTEGER NOT NULL,
+                PRIMARY KEY (product_id, snapshot_date)
+                ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_stock_snapshots_date ON stock_snapshots(snapshot_date)',
+
+        # The history starts here: the first snapshot is the current stock of every product
+        '''
+            INSERT OR IGNORE INTO stock_snapshots (snapshot_date, product_id, stock, last_movement_id)
+            SELECT CURRENT_TIMESTAMP, id, stock, 0 FROM products
+        ''',
+    ]),
+
+    # Old sales are moved to one SQLite file per year (see archive_sales_year_db). Moving them out must not change the
+    # dashboard totals and the rollups, so their delete triggers are skipped while an archive is running
+    (7, 'Yearly sales archives', [
+        '''
+            CREATE TABLE IF NOT EXISTS sales_archives (
+                "year" INTEGER PRIMARY KEY,
+                "file" TEXT NOT NULL,
+                "sales_count" INTEGER NOT NULL DEFAULT 0,
+                "archived_at" TIMESTAMP,
+                "archiving" INTEGER NOT NULL DEFAULT 0
+                )
+        ''',
+        'DROP TRIGGER IF EXISTS category_sales_totals_sale_delete',
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_sale_delete AFTER DELETE ON sales
+            WHEN NOT EXISTS (SELECT 1 FROM sales_archives WHERE archiving = 1) BEGIN
+                UPDATE category_sales_totals
+                SET total_sales = total_sales - old.total_price, units = units - old.quantity
+                WHERE category_id = (SELECT category_id FROM products WHERE id = old.product_id);
+            END
+        ''',
+        'DROP TRIGGER IF EXISTS sales_rollup_hour_delete',
+        '''
+            CREATE TRIGGER IF NOT EXISTS sales_rollup_hour_delete AFTER DELETE ON sales
+            WHEN NOT EXISTS (SELECT 1 FROM sales_archives WHERE archiving = 1) BEGIN
+                UPDATE sales_rollup_hour
+                SET sales_count = sales_count - 1, units = units - old.quantity, revenue = revenue - old.total_price
+                WHERE bucket = COALESCE(strftime('%Y-%m-%d %H:00:00', old.date), '') AND product_id = COALESCE(old.product_id, 0) AND payment_method = COALESCE(old.payment_method, '');
+            END
+        ''',
+        'DROP TRIGGER IF EXISTS sales_rollup_day_delete',
+        '''
+            CREATE TRIGGER IF NOT EXISTS sales_rollup_day_delete AFTER DELETE ON sales
+            WHEN NOT EXISTS (SELECT 1 FROM sales_archives WHERE archiving = 1) BEGIN
+                UPDATE sales_rollup_day
+                SET sales_count = sales_count - 1, units = units - old.quantity, revenue = revenue - old.total_price
+                WHERE bucket = COALESCE(strftime('%Y-%m-%d 00:00:00', old.date), '') AND product_id = COALESCE(old.product_id, 0) AND payment_method = COALESCE(old.payment_method, '');
+            END
+        ''',
+    ]),
+
+    # A product without category must not add its sales to the totals: category_id is the INTEGER PRIMARY KEY of the
+    # totals table, so a NULL gets a new id and the sale ends up in another category
+    (8, 'Skip products without category in the category totals triggers', [
+        'DROP TRIGGER IF EXISTS category_sales_totals_sale_insert',
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_sale_insert AFTER INSERT ON sales BEGIN
+                INSERT INTO category_sales_totals (category_id, total_sales, units)
+                SELECT p.category_id, new.total_price, new.quantity FROM products p WHERE p.id = new.product_id AND p.category_id IS NOT NULL
+                ON CONFLICT(category_id) DO UPDATE SET
+                    total_sales = total_sales + excluded.total_sales,
+                    units = units + excluded.units;
+            END
+        ''',
+        'DROP TRIGGER IF EXISTS category_sales_totals_sale_update',
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_sale_update AFTER UPDATE OF product_id, quantity, total_price ON sales BEGIN
+                UPDATE category_sales_totals
+                SET total_sales = total_sales - old.total_price, units = units - old.quantity
+                WHERE category_id = (SELECT category_id FROM products WHERE id = old.product_id);
+
+                INSERT INTO category_sales_totals (category_id, total_sales, units)
+                SELECT p.category_id, new.total_price, new.quantity FROM products p WHERE p.id = new.product_id AND p.category_id IS NOT NULL
+                ON CONFLICT(category_id) DO UPDATE SET
+                    total_sales = total_sales + excluded.total_sales,
+                    units = units + excluded.units;
+            END
+        ''',
+
+        # Remove what the old triggers booked to the wrong category. The daily rollup still counts the archived sales,
+        # so the totals are rebuilt from it instead of from the sales table
+        'DELETE FROM category_sales_totals',
+        '''
+            INSERT INTO category_sales_totals (category_id, total_sales, units)
+            SELECT p.category_id, SUM(r.revenue), SUM(r.units)
+            FROM sales_rollup_day r
+            JOIN products p ON r.product_id = p.id
+            WHERE p.category_id IS NOT NULL
+            GROUP BY p.category_id
+        ''',
+    ]),
+
+    # The triggers that take the sales of a deleted or moved product out of its category summed the sales table only,
+    # so the archived sales stayed in the dashboard. The daily rollup keeps the archived sales, so they read it instead
+    (9, 'Deleted and moved products take their archived sales with them in the category totals', [
+        'CREATE INDEX IF NOT EXISTS idx_sales_rollup_day_product_id ON sales_rollup_day (product_id)',
+        'DROP TRIGGER IF EXISTS category_sales_totals_product_delete',
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_product_delete AFTER DELETE ON products BEGIN
+                UPDATE category_sales_totals
+                SET total_sales = total_sales - (SELECT COALESCE(SUM(revenue), 0) FROM sales_rollup_day WHERE product_id = old.id),
+                    units = units - (SELECT COALESCE(SUM(units), 0) FROM sales_rollup_day WHERE product_id = old.id)
+                WHERE category_id = old.category_id;
+            END
+        ''',
+        'DROP TRIGGER IF EXISTS category_sales_totals_product_move',
+        '''
+            CREATE TRIGGER IF NOT EXISTS category_sales_totals_product_move AFTER UPDATE OF category_id ON products BEGIN
+                UPDATE category_sales_totals
+                SET total_sales = total_sales - (SELECT COALESCE(SUM(revenue), 0) FROM sales_rollup_day WHERE product_id = old.id),
+                    units = units - (SELECT COALESCE(SUM(units), 0) FROM sales_rollup_day WHERE product_id = old.id)
+                WHERE category_id = old.category_id;
+
+                INSERT INTO category_sales_totals (category_id, total_sales, units)
+                SELECT new.category_id, COALESCE(SUM(revenue), 0), COALESCE(SUM(units), 0) FROM sales_rollup_day
+                WHERE product_id = new.id AND new.category_id IS NOT NULL
+                ON CONFLICT(category_id) DO UPDATE SET
+                    total_sales = total_sales + excluded.total_sales,
+                    units = units + excluded.units;
+            END
+        ''',
+
+        # Remove the archived sales of the products deleted before this migration
+        'DELETE FROM category_sales_totals',
+        '''
+            INSERT INTO category_sales_totals (category_id, total_sales, units)
+            SELECT p.category_id, SUM(r.revenue), SUM(r.units)
+            FROM sales_rollup_day r
+            JOIN products p ON r.product_id = p.id
+            WHERE p.category_id IS NOT NULL
+            GROUP BY p.category_id
+        ''',
+    ]),
+]
+
+# Kinds of stock movements. quantity is positive when units come in and negative when they go out
+STOCK_MOVEMENT_KINDS = ('sale', 'adjustment', 'import', 'return')
+
+# Maximum number of archived years. The reports attach every archive file at the same time and SQLite attaches at most
+# 10 databases per connection (SQLITE_MAX_ATTACHED)
+MAX_ARCHIVED_YEARS = 10
+
+# Schema of the sales table inside every yearly archive file. No foreign keys: products and clients live in the main database
+ARCHIVE_SALES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {alias}.sales (
+        "id" INTEGER PRIMARY KEY,
+        "product_id" INTEGER,
+        "client_id" INTEGER,
+        "quantity" INTEGER NOT NULL,
+        "total_price" REAL NOT NULL,
+        "payment_method" TEXT,
+        "date" TIMESTAMP
+        )
+'''
+
+
+class DatabaseManager:
+
+    # Constructor. If the profile is not given, it is read from the INVENTORY_DB_PROFILE environment variable
+    def __init__(self, db_path, profile=None):
+        self.db_path = db_path
+
+        # Performance profile
+        self.profile = profile or os.environ.get(PROFILE_ENV_VAR) or DEFAULT_PROFILE
+
+        if self.profile not in PERFORMANCE_PROFILES:
+            raise ValueError('Unknown database profile "{}". Available profiles: {}'.format(self.profile, ', '.join(PERFORMANCE_PROFILES)))
+
+        # Connection pool. Every thread keeps its own persistent connection (SQLite connections must not be shared between threads while in use)
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._connections = []
+        self._closed = False
+
+        # Functions called after every committed write: callback(table, action, data). See add_change_listener()
+        self._change_listeners = []
+
+        # Pool statistics
+        self._stats = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'queries': 0,
+            'transactions': 0,
+            'rollbacks': 0,
+        }
+
+        self.check_db_folder()
+        self.initialize_db()
+
+    # Context manager support. "with DatabaseManager(path) as db:" closes every connection at the end
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+    
+    # Check db connection
+    def check_db_folder(self):
+
+        # Check the 'db' folder exists
+        folder = os.path.dirname(self.db_path)
+        if not os.path.exists(folder):
+            os.makedirs(folder) # If the db not exists, create it
+
+    # -- CONNECTION POOL --
+
+    # Open a new connection function. isolation_level=None keeps the connection in autocommit mode, transactions are opened explicitly with transaction()
+    def _open_connection(self):
+
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self._apply_profile(conn)
+
+        with self._pool_lock:
+            self._connections.append(conn)
+            self._stats['connections_opened'] += 1
+
+        return conn
+
+    # Apply profile function. Run the pragmas of the selected profile in a new connection
+    def _apply_profile(self, conn):
+
+        pragmas = PERFORMANCE_PROFILES[self.profile]
+
+        # busy_timeout first, so changing the journal mode waits for other connections instead of failing
+        conn.execute('PRAGMA busy_timeout = {}'.format(int(pragmas['busy_timeout'])))
+        conn.execute('PRAGMA journal_mode = {}'.format(pragmas['journal_mode']))
+        conn.execute('PRAGMA synchronous = {}'.format(pragmas['synchronous']))
+        conn.execute('PRAGMA cache_size = {}'.format(int(pragmas['cache_size'])))
+        conn.execute('PRAGMA mmap_size = {}'.format(int(pragmas['mmap_size'])))
+        conn.execute('PRAGMA temp_store = {}'.format(pragmas['temp_store']))
+
+    # Set profile function. Change the profile and apply it to the connection of the current thread.
+    # Other threads connections keep the old pragmas until they are released
+    def set_profile(self, profile):
+
+        if profile not in PERFORMANCE_PROFILES:
+            raise ValueError('Unknown database profile "{}". Available profiles: {}'.format(profile, ', '.join(PERFORMANCE_PROFILES)))
+
+        self.profile = profile
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._apply_profile(conn)
+
+    # Get effective pragmas function. Return the values SQLite is really using in the current connection
+    def get_effective_pragmas(self):
+
+        conn = self.get_connection()
+        pragmas = {'profile': self.profile}
+
+        for pragma in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout'):
+            row = conn.execute('PRAGMA {}'.format(pragma)).fetchone()
+            pragmas[pragma] = row[0] if row else None
+
+        return pragmas
+
+    # Get connection function. Return the persistent connection of the current thread, opening it the first time
+    def get_connection(self):
+
+        if self._closed:
+            raise sqlite3.ProgrammingError('DatabaseManager is closed.')
+
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            self._local.tx_depth = 0
+            self._local.pending_changes = []
+
+            # Sales archives attached to this connection and the years of the current sales_all view
+            self._local.attached = set()
+            self._local.sales_view = ()
+
+        with self._pool_lock:
+            self._stats['checkouts'] += 1
+
+        return conn
+
+    # Release the connection of the current thread. Worker threads should call it before finishing
+    def release_connection(self):
+
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+            return
+
+        self._local.conn = None
+
+        with self._pool_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+                self._stats['connections_closed'] += 1
+
+        conn.close()
+
+    # Close function. Close every pooled connection
+    def close(self):
+
+        with self._pool_lock:
+            connections = self._connections
+            self._connections = []
+            self._stats['connections_closed'] += len(connections)
+            self._closed = True
+
+        for conn in connections:
+            conn.close()
+
+        self._local = threading.local()
+
+    # Transaction context manager. Every run_query inside the block shares one transaction and one commit.
+    # Nested blocks join the outer transaction. BEGIN IMMEDIATE takes the write lock at the start to avoid lock upgrades deadlocks
+    @contextmanager
+    def transaction(self, immediate=True):
+
+        conn = self.get_connection()
+
+        if self._local.tx_depth > 0:
+            self._local.tx_depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.tx_depth -= 1
+            return
+
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        self._local.tx_depth = 1
+
         try:
-            self.run_query('INSERT INTO categories (id, name) VALUES (1, "General")')
-            self.run_query('INSERT INTO suppliers (id, name) VALUES (1, "Proveedor Local")')
-            self.run_query('INSERT INTO clients (id, name, email) VALUES (1, "Cliente Modelo", "cliente@correo.com")')
-        except sqlite3.IntegrityError:
-            pass
+            yield conn
+        except BaseException:
+            conn.rollback()
+            with self._pool_lock:
+                self._stats['rollbacks'] += 1
+
+            # The changes were not saved, the listeners must not know about them
+            self._local.pending_changes = []
+            raise
+        else:
+            conn.commit()
+            with self._pool_lock:
+                self._stats['transactions'] += 1
+        finally:
+            self._local.tx_depth = 0
+
+        self._flush_changes()
+
+    # -- CHANGE LISTENERS --
+    # In-memory indexes and caches subscribe here to know when the tables change.
+    # callback(table, action, data): table is the table name, action 'insert', 'update' or 'delete' and data a dict with the details.
+    # Stock changes of products use the action 'stock', with data['stock'] = {id: new stock} or data['delta'] = {id: units added}
+    # (a stock of None means that it is unknown).
+    # Inside transaction() the notifications wait until the commit (and are discarded on rollback)
+
+    # Add change listener function
+    def add_change_listener(self, callback):
+
+        self._change_listeners.append(callback)
+
+    # Remove change listener function
+    def remove_change_listener(self, callback):
+
+        if callback in self._change_listeners:
+            self._change_listeners.remove(callback)
+
+    # Notify change function. Call it after a write
+    def _notify_change(self, table, action, **data):
+
+        if not self._change_listeners:
+            return
+
+        self.get_connection()
+        self._local.pending_changes.append((table, action, data))
+
+        if self._local.tx_depth == 0:
+            self._flush_changes()
+
+    # Send the pending notifications of the current thread to the listeners
+    def _flush_changes(self):
+
+        pending = self._local.pending_changes
+        self._local.pending_changes = []
+
+        for table, action, data in pending:
+            for callback in list(self._change_listeners):
+                callback(table, action, data)
+
+    # Pool statistics function. Return a copy of the counters and the number of open connections
+    def get_pool_stats(self):
+
+        with self._pool_lock:
+            stats = dict(self._stats)
+            stats['open_connections'] = len(self._connections)
+
+        return stats
+
+    # Run query function. The connection is reused and, outside transaction(), each statement commits by itself (autocommit).
+    # record: a Record class (see modules/records.py). The rows are returned as instances of it instead of tuples
+    def run_query(self, query, parameters=(), record=None):
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        if record is not None:
+            cursor.row_factory = record.from_row
+
+        result = cursor.execute(query, parameters)
 
-    # Get products function. Return all the products
+        with self._pool_lock:
+            self._stats['queries'] += 1
+
+        return result
+
+    # Run many function. Execute the same statement for every parameters tuple with executemany (a single prepared statement)
+    def run_many(self, query, seq_of_parameters):
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        result = cursor.executemany(query, seq_of_parameters)
+
+        with self._pool_lock:
+            self._stats['queries'] += 1
+
+        return result
+
+    # Run query in chunks function. Run a SELECT with an "IN ({})" placeholder for a long list of values,
+    # in chunks to stay under the SQLite parameters limit. Return all the rows
+    def run_query_in_chunks(self, query, values, chunk_size=500, record=None):
+
+        values = list(values)
+        rows = []
+
+        for i in range(0, len(values), chunk_size):
+            chunk = values[i:i + chunk_size]
+            rows.extend(self.run_query(query.format(', '.join('?' * len(chunk))), chunk, record))
+
+        return rows
+
+    # Initialize db. Run the pending schema migrations
+    def initialize_db(self):
+
+        self.migrate()
+
+    # Get schema version function. The version is stored in the SQLite header (PRAGMA user_version)
+    def get_schema_version(self):
+
+        return self.run_query('PRAGMA user_version').fetchone()[0]
+
+    # Migrate function. Apply every migration newer than the database version in a single transaction.
+    # If the database is already up to date, no DDL is executed at all. Return the list of applied versions
+    def migrate(self):
+
+        latest_version = MIGRATIONS[-1][0]
+
+        # Fast path: nothing to do
+        if self.get_schema_version() >= latest_version:
+            return []
+
+        applied = []
+
+        with self.transaction():
+
+            # Read the version again inside the write lock, another process may have migrated meanwhile
+            current_version = self.get_schema_version()
+
+            for version, description, statements in MIGRATIONS:
+
+                if version <= current_version:
+                    continue
+
+                for statement in statements:
+                    self.run_query(statement)
+
+                applied.append(version)
+
+            # PRAGMA does not accept parameters
+            self.run_query('PRAGMA user_version = {}'.format(int(latest_version)))
+
+        return applied
+
+    # Get products function. Return all the products (ProductRecord rows)
     def get_products_db(self):
 
-        query = 'SELECT * FROM products ORDER BY name DESC'
-        return self.run_query(query)
+        query = 'SELECT {} FROM products ORDER BY name DESC'.format(ProductRecord.columns())
+        return self.run_query(query, record=ProductRecord)
 
     # Search product function. Search products by name
     def search_product_db(self, search_term):
 
-        query = 'SELECT * FROM products WHERE name = ?'
+        query = 'SELECT {} FROM products WHERE name = ?'.format(ProductRecord.columns())
         parameters = ('{}'.format(search_term),) 
-        return self.run_query(query, parameters)
+        return self.run_query(query, parameters, ProductRecord)
+
+    # Full text search function. match is an FTS5 query (see ProductLogic.search_products). Return the best ranked products first.
+    # Only the first max_candidates matches are ranked: ranking every match of a very common prefix ("a*") costs hundreds of ms with big catalogues
+    def search_products_fts_db(self, match, limit, max_candidates=2000):
+
+        query = '''
+            SELECT {}
+            FROM (
+                SELECT rowid, rank FROM products_fts
+                WHERE products_fts MATCH ?
+                LIMIT ?
+                ) f
+            JOIN products p ON p.id = f.rowid
+            ORDER BY f.rank
+            LIMIT ?
+            '''.format(ProductRecord.columns('p'))
+        return self.run_query(query, (match, max(int(max_candidates), int(limit)), int(limit)), ProductRecord)
 
     # Insert product function. Insert a new product
     def insert_product_db(self, name, price, stock, category_id):
 
         query = 'INSERT INTO products VALUES(NULL, ?, ?, ?, "No description", ?, 1)'
         parameters = (name, price, stock, category_id)
-        self.run_query(query, parameters)
+
+        # The product and its initial stock in the ledger are saved together
+        with self.transaction():
+            cursor = self.run_query(query, parameters)
+            self.run_query(
+                "INSERT INTO stock_movements (product_id, kind, quantity) SELECT id, 'import', stock FROM products WHERE id = ? AND stock != 0",
+                (cursor.lastrowid,)
+            )
+            self._notify_change('products', 'insert', names=[name])
+
+    # Insert products bulk function. Insert many products (name, price, stock, category_id) in a single transaction.
+    # Products whose name already exists (in the table or in a previous row) are skipped. Return the number of inserted rows
+    # and the list of skipped names. Any other invalid row raises and cancels the whole import, no row is lost silently
+    def insert_products_bulk(self, rows):
+
+        rows = list(rows)
+        skipped = []
+        new_rows = []
+
+        with self.transaction():
+
+            # Look for the names that already exist
+            rows_existing = self.run_query_in_chunks('SELECT name FROM products WHERE name IN ({})', [row[0] for row in rows])
+            seen = {row[0] for row in rows_existing}
+
+            for row in rows:
+                if row[0] in seen:
+                    skipped.append(row[0])
+                else:
+                    seen.add(row[0])
+                    new_rows.append(row)
+
+            query = 'INSERT INTO products VALUES(NULL, ?, ?, ?, "No description", ?, 1)'
+            rowcount = self.run_many(query, new_rows).rowcount
+
+            # Initial stock of the new products in the ledger
+            self.run_many(
+                "INSERT INTO stock_movements (product_id, kind, quantity) SELECT id, 'import', stock FROM products WHERE name = ? AND stock != 0",
+                [(row[0],) for row in new_rows]
+            )
+            self._notify_change('products', 'insert', names=[row[0] for row in new_rows])
+
+        return rowcount, skipped
+
+    # Get product names function. Return only the names of all the products, ordered by name (descending)
+    def get_product_names_db(self):
+
+        return self.run_query('SELECT name FROM products ORDER BY name DESC')
+
+    # Get products by names function. Return all the product rows whose name is in the list (one query per 500 names)
+    def get_products_by_names_db(self, names):
+
+        query = 'SELECT {} FROM products WHERE name IN ({{}})'.format(ProductRecord.columns())
+        return self.run_query_in_chunks(query, names, record=ProductRecord)
 
     # Delete product function. Delete a product by name
     def delete_product_db(self, name):
 
         query = 'DELETE FROM products WHERE name = ?'
-        self.run_query(query, (name,))
+        cursor = self.run_query(query, (name,))
+
+        if cursor.rowcount:
+            self._notify_change('products', 'delete', names=[name])
         
     # Update an existint product function. Update an existing product by name and price.
     def update_product_db(self, new_name, new_price, old_name):
 
         query = 'UPDATE products SET name = ?, price = ? WHERE name = ?'
         parameters = (new_name, new_price, old_name) 
-        self.run_query(query, parameters)
+        cursor = self.run_query(query, parameters)
+
+        if cursor.rowcount:
+            self._notify_change('products', 'update', old_name=old_name, new_name=new_name)
 
     # Function to get products filtered by Category ID
     def get_products_by_category_db(self, category_id):
         
-        query = 'SELECT * FROM products WHERE category_id = ? ORDER BY name DESC'
-        return self.run_query(query, (category_id,))
+        query = 'SELECT {} FROM products WHERE category_id = ? ORDER BY name DESC'.format(ProductRecord.columns())
+        return self.run_query(query, (category_id,), ProductRecord)
     
     # Function to get only actives products (Stock > 0)
     def get_active_products_db(self):
 
-        query = 'SELECT * FROM products WHERE stock > 0 ORDER BY name DESC'
-        return self.run_query(query)
+        query = 'SELECT {} FROM products WHERE stock > 0 ORDER BY name DESC'.format(ProductRecord.columns())
+        return self.run_query(query, record=ProductRecord)
     
     # Function to get active products filtered by Category
     def get_active_products_by_category_db(self, category_id):
 
-        query = 'SELECT * FROM products WHERE category_id = ? AND stock > 0 ORDER BY name DESC'
-        return self.run_query(query, (category_id,))
+        query = 'SELECT {} FROM products WHERE category_id = ? AND stock > 0 ORDER BY name DESC'.format(ProductRecord.columns())
+        return self.run_query(query, (category_id,), ProductRecord)
+    
+    # Build the WHERE clause shared by the page and count queries
+    def _products_filter(self, category_id, only_active):
+
+        conditions = []
+        parameters = []
+
+        if category_id is not None:
+            conditions.append('category_id = ?')
+            parameters.append(category_id)
+
+        if only_active:
+            conditions.append('stock > 0')
+
+        return conditions, parameters
+
+    # Function to get one page of products ordered by name (keyset pagination).
+    # after_name is the name of the last row of the previous page (None for the first page). Names are unique, so the name is enough as cursor.
+    # before_name goes backwards: the page just before that name (still returned in ascending order).
+    # Unlike OFFSET, SQLite jumps directly to the cursor using the name index, so every page costs the same
+    def get_products_page_db(self, limit, after_name=None, category_id=None, only_active=False, before_name=None):
+
+        conditions, parameters = self._products_filter(category_id, only_active)
+        order = 'ASC'
+
+        if after_name is not None:
+            conditions.append('name > ?')
+            parameters.append(after_name)
+
+        if before_name is not None:
+            conditions.append('name < ?')
+            parameters.append(before_name)
+            order = 'DESC'
+
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        query = 'SELECT {} FROM products {} ORDER BY name {} LIMIT ?'.format(ProductRecord.columns(), where, order)
+        parameters.append(int(limit))
+
+        rows = self.run_query(query, parameters, ProductRecord).fetchall()
+
+        if order == 'DESC':
+            rows.reverse()
+
+        return rows
+
+    # Function to count the products that match a filter
+    def count_products_db(self, category_id=None, only_active=False):
+
+        conditions, parameters = self._products_filter(category_id, only_active)
+
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        query = 'SELECT COUNT(*) FROM products {}'.format(where)
+
+        return self.run_query(query, parameters).fetchone()[0]
     
 
 # -- CATEGORIES -- 
@@ -169,11 +1053,17 @@ class DatabaseManager:
     def insert_category_db(self, name):
         query = 'INSERT INTO categories (name) VALUES (?)'
         self.run_query(query, (name,))
+        self._notify_change('categories', 'insert', names=[name])
 
     # Delete category function. Delete an existing category by name. Return the cursor if anything was deleted.
     def delete_category_db(self, name):
         query = 'DELETE FROM categories WHERE name = ?'
-        return self.run_query(query, (name,))
+        cursor = self.run_query(query, (name,))
+
+        if cursor.rowcount:
+            self._notify_change('categories', 'delete', names=[name])
+
+        return cursor
     
 
 # -- SUPPLIERS --
@@ -186,11 +1076,17 @@ class DatabaseManager:
     def insert_supplier_db(self, name, phone):
         query = 'INSERT INTO suppliers (name, phone) VALUES (?, ?)'
         self.run_query(query, (name, phone))
+        self._notify_change('suppliers', 'insert', names=[name])
 
     # Delete suppliers function. Delete an existing supplier by name. Return the cursor if anything was deleted.
     def delete_supplier_db(self, name):
         query = 'DELETE FROM suppliers WHERE name = ?'
-        return self.run_query(query, (name,))
+        cursor = self.run_query(query, (name,))
+
+        if cursor.rowcount:
+            self._notify_change('suppliers', 'delete', names=[name])
+
+        return cursor
     
 
 # -- CLIENTS --
@@ -203,11 +1099,17 @@ class DatabaseManager:
     def insert_client_db(self, name, email, notes):
         query = 'INSERT INTO clients (name, email, notes) VALUES (?, ?, ?)'
         self.run_query(query, (name, email, notes))
+        self._notify_change('clients', 'insert', names=[name])
 
     # Delete client function. Delete an existing client by name. Return the cursor if anything was deleted.
     def delete_client_db(self, name):
         query = 'DELETE FROM clients WHERE name = ?'
-        return self.run_query(query, (name,))
+        cursor = self.run_query(query, (name,))
+
+        if cursor.rowcount:
+            self._notify_change('clients', 'delete', names=[name])
+
+        return cursor
     
     # Function to select an ID client based on their name
     def get_client_id_by_name_db(self, name):
@@ -217,16 +1119,45 @@ class DatabaseManager:
     
 
 # -- SALES --
-    # Get sales function. Return all the sales
+    # Get sales function. Return all the sales (SaleRecord rows)
     def get_sales_report_db(self):
         query = '''
             SELECT s.id, p.name, c.name, s.quantity, s.total_price, s.date
-            FROM sales s
+            FROM {} s
             JOIN products p ON s.product_id = p.id
             JOIN clients c ON s.client_id = c.id
             ORDER BY s.date DESC
+            '''.format(self._sales_source())
+        return self.run_query(query, record=SaleRecord)
+    
+    # Get a page of the sales report function. Same rows as get_sales_report_db, newest first, using (date, id) as keyset cursor:
+    # after_date and after_id are the date and id of the last row of the previous page (None for the first page)
+    def get_sales_report_page_db(self, limit, after_date=None, after_id=None):
+
+        where = ''
+        branch_parameters = []
+
+        if after_date is not None:
+            where = 'WHERE (s.date, s.id) < (?, ?)'
+            branch_parameters = [after_date, after_id]
+
+        branch = '''
+            SELECT s.id, p.name, c.name, s.quantity, s.total_price, s.date
+            FROM {}.sales s
+            JOIN main.products p ON s.product_id = p.id
+            JOIN main.clients c ON s.client_id = c.id
+            {}
             '''
-        return self.run_query(query)
+
+        # With archives, one SELECT per file joined with UNION ALL. SQLite merges them walking the date index of every
+        # file and stops after limit rows, instead of sorting the whole sales_all view for every page
+        schemas = ['main']
+        if self._sales_source() != 'sales':
+            schemas += ['archive_{}'.format(year) for year in self._local.sales_view]
+
+        query = '{} ORDER BY 6 DESC, 1 DESC LIMIT ?'.format(' UNION ALL '.join(branch.format(schema, where) for schema in schemas))
+
+        return self.run_query(query, branch_parameters * len(schemas) + [int(limit)], SaleRecord)
     
     # Insert new sales function
     def insert_sales_db(self, product_id, client_id, quantity, total, method):
@@ -234,23 +1165,385 @@ class DatabaseManager:
         self.run_query(query, (product_id, client_id, quantity, total, method))
 
 
-    # Update product stock function
-    def update_product_stock_db(self, id, stock):
-        query = 'UPDATE products SET stock = ? WHERE id = ?'
-        return self.run_query(query,(stock, id))
+    # Insert many sales function. rows: (product_id, client_id, quantity, total, method, date). If date is None the current timestamp is used
+    def insert_sales_bulk_db(self, rows):
+        query = 'INSERT INTO sales (product_id, client_id, quantity, total_price, payment_method, date) VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))'
+        return self.run_many(query, rows)
+
+
+    # WHERE clause (and its parameters) of a stock write on one product. If name (and price) are given they must match too,
+    # so a write made with a cached row that another till renamed, deleted (or repriced) changes nothing
+    def _product_guard(self, id, name=None, price=None):
+
+        condition, parameters = 'id = ?', (id,)
+
+        if name is not None:
+            condition, parameters = condition + ' AND name = ?', parameters + (name,)
+
+        if price is not None:
+            condition, parameters = condition + ' AND price = ?', parameters + (price,)
+
+        return condition, parameters
+
+    # Update product stock function. The difference with the old stock is recorded in the ledger as an adjustment.
+    # name: see _product_guard. Return the cursor: rowcount is 0 if the product was not found
+    def update_product_stock_db(self, id, stock, name=None):
+        condition, parameters = self._product_guard(id, name)
+        query = 'UPDATE products SET stock = ? WHERE {}'.format(condition)
+
+        with self.transaction():
+            self.run_query(
+                "INSERT INTO stock_movements (product_id, kind, quantity) SELECT id, 'adjustment', ? - stock FROM products WHERE {} AND stock != ?".format(condition),
+                (stock,) + parameters + (stock,)
+            )
+            cursor = self.run_query(query, (stock,) + parameters)
+
+            if cursor.rowcount:
+                self._notify_change('products', 'stock', stock={id: stock})
+
+        return cursor
+
+    # Decrement product stock function. The stock is only subtracted if there is enough, so two tills selling the same product can never leave it negative.
+    # name and price: see _product_guard. Return the cursor: rowcount is 0 if the stock was not enough (or the product didnt match)
+    def decrement_product_stock_db(self, id, quantity, name=None, price=None):
+        condition, parameters = self._product_guard(id, name, price)
+        query = 'UPDATE products SET stock = stock - ? WHERE {} AND stock >= ?'.format(condition)
+
+        # The movement has the same condition as the update, so it is only recorded if the stock is subtracted
+        with self.transaction():
+            self.run_query(
+                "INSERT INTO stock_movements (product_id, kind, quantity) SELECT id, 'sale', -? FROM products WHERE {} AND stock >= ?".format(condition),
+                (quantity,) + parameters + (quantity,)
+            )
+            cursor = self.run_query(query, (quantity,) + parameters + (quantity,))
+
+            if cursor.rowcount:
+                self._notify_change('products', 'stock', delta={id: -quantity})
+
+        return cursor
+
+    # Increment product stock function. Add units to a product and record them in the ledger (kind 'return' or 'import').
+    # name: see _product_guard. Return the cursor: rowcount is 0 if the product was not found
+    def increment_product_stock_db(self, id, quantity, kind='return', name=None):
+
+        if kind not in STOCK_MOVEMENT_KINDS:
+            raise ValueError('Unknown stock movement kind "{}".'.format(kind))
+
+        condition, parameters = self._product_guard(id, name)
+
+        with self.transaction():
+            self.run_query(
+                'INSERT INTO stock_movements (product_id, kind, quantity) SELECT id, ?, ? FROM products WHERE {}'.format(condition),
+                (kind, quantity) + parameters
+            )
+            cursor = self.run_query('UPDATE products SET stock = stock + ? WHERE {}'.format(condition), (quantity,) + parameters)
+
+            if cursor.rowcount:
+                self._notify_change('products', 'stock', delta={id: quantity})
+
+        return cursor
+
+
+    # Decrement many products stock function. items: (product_id, quantity). Return the cursor, rowcount is the number of products updated
+    def decrement_products_stock_bulk_db(self, items):
+
+        items = list(items)
+        query = 'UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?'
+        parameters = [(quantity, id, quantity) for id, quantity in items]
+
+        with self.transaction():
+            self.run_many("INSERT INTO stock_movements (product_id, kind, quantity) SELECT id, 'sale', -? FROM products WHERE id = ? AND stock >= ?", parameters)
+            cursor = self.run_many(query, parameters)
+
+            # If some product was not updated we dont know which one, so the stock of all of them is unknown
+            if cursor.rowcount == len(items):
+                self._notify_change('products', 'stock', delta={id: -quantity for id, quantity in items})
+            else:
+                self._notify_change('products', 'stock', stock={id: None for id, quantity in items})
+
+        return cursor
     
 
+    # Get sales by category function. Read the totals kept by the triggers, one row per category instead of summing all the sales
     def get_sales_by_category_db(self):
         query = '''
             SELECT c.name as category_name,
-            SUM(s.total_price) as total_sales
-            FROM sales s
-            JOIN products p 
-            ON s.product_id = p.id
+            t.total_sales as total_sales
+            FROM category_sales_totals t
             JOIN categories c
-            ON p.category_id = c.id
-            GROUP BY category_name
+            ON t.category_id = c.id
+            WHERE t.units > 0
             ORDER BY total_sales DESC
         '''
 
-        return self.run_query(query).fetchall()
\ No newline at end of file
+        return self.run_query(query).fetchall()
+
+    # Rebuild the sales totals by category from the sales table (and the archives). Only needed if the totals were changed by hand
+    def rebuild_category_sales_totals_db(self):
+
+        source = self._sales_source()
+
+        with self.transaction():
+            self.run_query('DELETE FROM category_sales_totals')
+            self.run_query('''
+                INSERT INTO category_sales_totals (category_id, total_sales, units)
+                SELECT p.category_id, SUM(s.total_price), SUM(s.quantity)
+                FROM {} s
+                JOIN products p ON s.product_id = p.id
+                WHERE p.category_id IS NOT NULL
+                GROUP BY p.category_id
+            '''.format(source))
+
+
+    # Get sales summary function. Sum units, revenue and number of sales between start (included) and end (excluded), grouped by
+    # product, category, payment_method or nothing. grain 'hour' or 'day' reads the rollup tables, None reads the raw sales.
+    # Ranges read from a rollup must be aligned to its grain. Return (key, units, revenue, sales_count) rows
+    def get_sales_summary_db(self, start, end, group_by=None, grain=None):
+
+        if group_by not in SALES_SUMMARY_GROUPS:
+            raise ValueError('Unknown sales summary group "{}".'.format(group_by))
+
+        if grain is None:
+            source = self._sales_source()
+            date_column = 'r.date'
+            sums = 'SUM(r.quantity), SUM(r.total_price), COUNT(*)'
+        else:
+            source = SALES_ROLLUP_TABLES[grain]
+            date_column = 'r.bucket'
+            sums = 'SUM(r.units), SUM(r.revenue), SUM(r.sales_count)'
+
+        query = '''
+            SELECT {key} AS summary_key, {sums}
+            FROM {source} r
+            LEFT JOIN products p ON r.product_id = p.id
+            LEFT JOIN categories c ON p.category_id = c.id
+            WHERE {date_column} >= ? AND {date_column} < ?
+            GROUP BY summary_key
+        '''.format(key=SALES_SUMMARY_GROUPS[group_by], sums=sums, source=source, date_column=date_column)
+
+        return self.run_query(query, (start, end)).fetchall()
+
+    # Get daily sales function. Return (day, product_id, units, revenue) rows of the daily rollup between start (included)
+    # and end (excluded), both 'YYYY-MM-DD'. day is the number of days since start
+    def get_daily_sales_db(self, start, end):
+
+        query = '''
+            SELECT CAST(ROUND(julianday(bucket) - julianday(?)) AS INTEGER), product_id, units, revenue
+            FROM sales_rollup_day
+            WHERE bucket >= ? AND bucket < ? AND sales_count > 0
+        '''
+        return self.run_query(query, (start, start, end))
+
+    # Get product columns function. Return (id, name, price, stock, category_id) of every product ordered by id (for the analytics)
+    def get_product_columns_db(self):
+
+        return self.run_query('SELECT id, name, price, stock, COALESCE(category_id, 0) FROM products ORDER BY id')
+
+    # Get sales since function. Return (id, product_id, client_id, quantity, total, payment_method, date) of the sales with
+    # an id greater than after_id ordered by id, archives included (for the columnar snapshot). date is Unix time, 0 if missing
+    def get_sales_since_db(self, after_id=0):
+
+        query = '''
+            SELECT id, COALESCE(product_id, 0), COALESCE(client_id, 0), quantity, total_price, COALESCE(payment_method, ''),
+                   COALESCE(CAST(strftime('%s', date) AS INTEGER), 0)
+            FROM {}
+            WHERE id > ?
+            ORDER BY id
+        '''.format(self._sales_source())
+
+        return self.run_query(query, (after_id,))
+
+    # Rebuild the hourly and daily rollups from the sales table (and the archives)
+    def rebuild_sales_rollups_db(self):
+
+        source = self._sales_source()
+
+        with self.transaction():
+            self.run_query('DELETE FROM sales_rollup_hour')
+            self.run_query('''
+                INSERT INTO sales_rollup_hour (bucket, product_id, payment_method, sales_count, units, revenue)
+                SELECT COALESCE(strftime('%Y-%m-%d %H:00:00', date), ''), COALESCE(product_id, 0), COALESCE(payment_method, ''), COUNT(*), SUM(quantity), SUM(total_price)
+                FROM {}
+                GROUP BY 1, 2, 3
+            '''.format(source))
+            self.run_query('DELETE FROM sales_rollup_day')
+            self.run_query('''
+                INSERT INTO sales_rollup_day (bucket, product_id, payment_method, sales_count, units, revenue)
+                SELECT COALESCE(strftime('%Y-%m-%d 00:00:00', bucket), ''), product_id, payment_method, SUM(sales_count), SUM(units), SUM(revenue)
+                FROM sales_rollup_hour
+                GROUP BY 1, 2, 3
+            ''')
+
+
+# -- SALES ARCHIVE --
+    # Closed years of sales are moved to one SQLite file per year, in the 'archive' folder next to the database, so the
+    # live database stays small. The archives are attached on demand to every connection and the reports read the
+    # temporary view sales_all (main.sales UNION ALL every archive) instead of the sales table.
+    # SQLite attaches up to 10 databases per connection by default, so up to 10 archived years can be read at the same time.
+
+    # Get the path of the archive file of a year
+    def get_archive_path(self, year):
+
+        base_name = os.path.splitext(os.path.basename(self.db_path))[0]
+        return os.path.join(os.path.dirname(self.db_path), 'archive', '{}_sales_{}.db'.format(base_name, int(year)))
+
+    # Attach the archive of a year to the connection of the current thread (ATTACH is not allowed inside a transaction).
+    # Return the schema name of the archive
+    def _attach_archive(self, year):
+
+        conn = self.get_connection()
+        alias = 'archive_{}'.format(int(year))
+
+        if alias not in self._local.attached:
+            path = self.get_archive_path(year)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            conn.execute('ATTACH DATABASE ? AS {}'.format(alias), (path,))
+            conn.execute(ARCHIVE_SALES_SCHEMA.format(alias=alias))
+            conn.execute('CREATE INDEX IF NOT EXISTS {}.idx_sales_date ON sales(date)'.format(alias))
+
+            self._local.attached.add(alias)
+
+        return alias
+
+    # Return the name of the table or view the sales reports must read: 'sales' if nothing is archived, otherwise the
+    # temporary view sales_all, created again when a new year is archived
+    def _sales_source(self):
+
+        years = tuple(row[0] for row in self.run_query('SELECT year FROM sales_archives WHERE sales_count > 0 ORDER BY year'))
+
+        if not years:
+            return 'sales'
+
+        if self._local.sales_view != years:
+
+            aliases = [self._attach_archive(year) for year in years]
+            conn = self.get_connection()
+
+            conn.execute('DROP VIEW IF EXISTS temp.sales_all')
+            conn.execute('CREATE TEMP VIEW sales_all AS SELECT * FROM main.sales {}'.format(
+                ' '.join('UNION ALL SELECT * FROM {}.sales'.format(alias) for alias in aliases)
+            ))
+
+            self._local.sales_view = years
+
+        return 'sales_all'
+
+    # Get archived years function. Return every year of the archives catalogue (also the ones without sales)
+    def get_archived_years_db(self):
+
+        return [row[0] for row in self.run_query('SELECT year FROM sales_archives ORDER BY year')]
+
+    # Get sales archives function. Return (year, file, sales_count, archived_at) for every archived year
+    def get_sales_archives_db(self):
+
+        return self.run_query('SELECT year, file, sales_count, archived_at FROM sales_archives WHERE sales_count > 0 ORDER BY year').fetchall()
+
+    # Get sales years function. Return the years that still have sales in the live database
+    def get_sales_years_db(self):
+
+        query = "SELECT DISTINCT CAST(substr(date, 1, 4) AS INTEGER) FROM sales WHERE date IS NOT NULL ORDER BY 1"
+        return [row[0] for row in self.run_query(query)]
+
+    # Archive sales year function. Move the sales of a year from the live database to its archive file.
+    # The copy is committed before the delete, and the archive ignores ids it already has, so running it again after an
+    # interruption finishes the work without duplicates or lost sales. Return the number of sales moved.
+    # Raise ValueError if the year would be a new archive and there are already MAX_ARCHIVED_YEARS
+    def archive_sales_year_db(self, year):
+
+        year = int(year)
+        start, end = '{:04d}-01-01 00:00:00'.format(year), '{:04d}-01-01 00:00:00'.format(year + 1)
+
+        archived = self.get_archived_years_db()
+
+        if year not in archived and len(archived) >= MAX_ARCHIVED_YEARS:
+            raise ValueError('At most {} years can be archived (SQLite attaches at most {} databases).'.format(MAX_ARCHIVED_YEARS, MAX_ARCHIVED_YEARS))
+
+        alias = self._attach_archive(year)
+
+        # A transaction that writes the main database (WAL) and the archive is not atomic across the two files, a crash in the
+        # commit could keep the delete and lose the copy. So the copy is committed first, and then only the sales the archive
+        # already holds are deleted. If it stops between the two, running it again copies nothing new and finishes the delete
+        with self.transaction():
+            self.run_query('INSERT OR IGNORE INTO {}.sales SELECT * FROM main.sales WHERE date >= ? AND date < ?'.format(alias), (start, end))
+
+        with self.transaction():
+
+            # While archiving is 1 the delete triggers of the totals and rollups are skipped
+            self.run_query(
+                'INSERT INTO sales_archives (year, file, archiving) VALUES (?, ?, 1) ON CONFLICT(year) DO UPDATE SET archiving = 1',
+                (year, os.path.basename(self.get_archive_path(year)))
+            )
+
+            moved = self.run_query(
+                'DELETE FROM main.sales WHERE date >= ? AND date < ? AND id IN (SELECT id FROM {}.sales)'.format(alias), (start, end)
+            ).rowcount
+
+            self.run_query(
+                'UPDATE sales_archives SET archiving = 0, sales_count = (SELECT COUNT(*) FROM {}.sales), archived_at = CURRENT_TIMESTAMP WHERE year = ?'.format(alias),
+                (year,)
+            )
+
+        return moved
+
+    # Vacuum function. Rebuild the live database file to give back the space of the deleted rows (not allowed inside a transaction)
+    def vacuum_db(self):
+
+        self.get_connection().execute('VACUUM main')
+
+
+# -- STOCK MOVEMENTS --
+    # Get stock movements function. Return the last movements (id, date, kind, quantity) of a product, the newest first
+    def get_stock_movements_db(self, product_id, limit=100):
+        query = 'SELECT id, date, kind, quantity FROM stock_movements WHERE product_id = ? ORDER BY id DESC LIMIT ?'
+        return self.run_query(query, (product_id, int(limit)))
+
+    # Create stock snapshot function. Save the current stock and the last movement it includes, only for the products with
+    # movements since the last snapshot: for the others the newest snapshot is still their stock, and get_stock_as_of_db
+    # already takes the newest snapshot of every product. Return the number of products saved
+    def create_stock_snapshot_db(self):
+
+        with self.transaction():
+            cursor = self.run_query('''
+                INSERT OR REPLACE INTO stock_snapshots (snapshot_date, product_id, stock, last_movement_id)
+                SELECT CURRENT_TIMESTAMP, id, stock, (SELECT COALESCE(MAX(id), 0) FROM stock_movements) FROM products
+                WHERE id IN (
+                    SELECT product_id FROM stock_movements
+                    WHERE id > (SELECT COALESCE(MAX(last_movement_id), 0) FROM stock_snapshots)
+                    )
+            ''')
+
+        return cursor.rowcount
+
+    # Get the date of the newest stock snapshot (None if there is none)
+    def get_last_stock_snapshot_date_db(self):
+
+        return self.run_query('SELECT MAX(snapshot_date) FROM stock_snapshots').fetchone()[0]
+
+    # Get stock as of function. Return (product_id, stock) rows with the stock at a date ('YYYY-MM-DD HH:MM:SS').
+    # Every product starts from its newest snapshot before that date and only adds the movements after the snapshot,
+    # so the scan is as short as the time between snapshots. Products without a snapshot before the date start from 0
+    # (they were created later and their initial stock is an 'import' movement).
+    # product_id: only that product
+    def get_stock_as_of_db(self, as_of, product_id=None):
+
+        query = '''
+            WITH base AS (
+                SELECT p.id AS product_id,
+                    (SELECT s.snapshot_date FROM stock_snapshots s
+                        WHERE s.product_id = p.id AND s.snapshot_date <= :as_of
+                        ORDER BY s.snapshot_date DESC LIMIT 1) AS snapshot_date
+                FROM products p
+                WHERE :product_id IS NULL OR p.id = :product_id
+                )
+            SELECT b.product_id,
+                COALESCE(s.stock, 0) + COALESCE((
+                    SELECT SUM(m.quantity) FROM stock_movements m
+                    WHERE m.product_id = b.product_id AND m.id > COALESCE(s.last_movement_id, 0) AND m.date <= :as_of
+                    ), 0) AS stock
+            FROM base b
+            LEFT JOIN stock_snapshots s ON s.product_id = b.product_id AND s.snapshot_date = b.snapshot_date
+            ORDER BY b.product_id
+        '''
+
+        return self.run_query(query, {'as_of': as_of, 'product_id': product_id}).fetchall()
@@ -0,0 +1,153 @@
+"""
+In this script only include code to run database work outside the Tkinter main thread
+"""
+
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+# DATABASE EXECUTOR
+# The queries run in worker threads (each one with its own pooled connection from DatabaseManager) and the results
+# come back to the Tk thread through a queue that is polled with widget.after(). Tkinter is not thread safe, so the
+# callbacks are always called from the main loop, never from the workers.
+class DatabaseExecutor:
+
+    # Constructor
+    # widget: any Tk widget, used for after(). max_workers: worker threads (SQLite in WAL mode allows reads while one thread writes).
+    # on_busy_change(busy): called when the executor starts or stops having work, to show a busy indicator.
+    # on_task_error(exception): called for the failed tasks submitted without on_error, to show the error to the user.
+    # Without it, the error goes to the Tk error handler (report_callback_exception)
+    def __init__(self, widget, max_workers=2, poll_ms=30, on_busy_change=None, on_task_error=None):
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self.on_busy_change = on_busy_change
+        self.on_task_error = on_task_error
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db-worker')
+        self._results = queue.Queue()
+
+        # Last generation and pending future of every key (see submit)
+        self._generations = {}
+        self._futures = {}
+
+        self._pending = 0
+        self._poll_id = None
+        self._closed = False
+
+    # Submit function. Run func(*args, **kwargs) in a worker and call on_done(result) or on_error(exception) in the Tk thread.
+    # key: tasks with the same key supersede each other. If a new task is submitted, the older one is cancelled if it did
+    # not start yet, and its result is ignored if it was already running (a newer filter wins over an older one)
+    def submit(self, func, *args, key=None, on_done=None, on_error=None, **kwargs):
+
+        if self._closed:
+            return None
+
+        generation = None
+
+        if key is not None:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+
+            # Cancel the previous task of the same key if it is still waiting
+            previous = self._futures.pop(key, None)
+            if previous is not None and previous.cancel():
+                self._task_finished()
+
+        token = (key, generation, on_done, on_error)
+        future = self._pool.submit(self._run, token, func, args, kwargs)
+
+        if key is not None:
+            self._futures[key] = future
+
+        self._pending += 1
+
+        if self._pending == 1:
+            self._notify_busy(True)
+            self._schedule_poll()
+
+        return future
+
+    # Worker side. Never touch Tk here, only the queue
+    def _run(self, token, func, args, kwargs):
+
+        try:
+            result = func(*args, **kwargs)
+            self._results.put((token, True, result))
+
+        except Exception as e:
+            self._results.put((token, False, e))
+
+    # Is busy function. True while there are tasks running or waiting
+    def is_busy(self):
+
+        return self._pending > 0
+
+    # Poll the results queue from the Tk thread
+    def _schedule_poll(self):
+
+        if self._poll_id is None and not self._closed:
+            self._poll_id = self.widget.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+
+        self._poll_id = None
+
+        while True:
+            try:
+                token, ok, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            key, generation, on_done, on_error = token
+
+            if key is not None and self._futures.get(key) is not None and self._generations.get(key) == generation:
+                self._futures.pop(key, None)
+
+            self._task_finished()
+
+            # A newer task with the same key was submitted: this result is stale
+            if key is not None and self._generations.get(key) != generation:
+                continue
+
+            if ok:
+                if on_done is not None:
+                    on_done(value)
+
+            elif on_error is not None:
+                on_error(value)
+
+            elif self.on_task_error is not None:
+                self.on_task_error(value)
+
+            else:
+                self.widget._root().report_callback_exception(type(value), value, value.__traceback__)
+
+        if self._pending > 0:
+            self._schedule_poll()
+
+    # Update the pending counter when a task ends or is cancelled
+    def _task_finished(self):
+
+        self._pending = max(self._pending - 1, 0)
+
+        if self._pending == 0:
+            self._notify_busy(False)
+
+    def _notify_busy(self, busy):
+
+        if self.on_busy_change is not None:
+            self.on_busy_change(busy)
+
+    # Shutdown function. Cancel the waiting tasks and wait for the running ones
+    def shutdown(self, wait=True):
+
+        self._closed = True
+
+        if self._poll_id is not None:
+            try:
+                self.widget.after_cancel(self._poll_id)
+            except Exception:
+                pass # The window could be already destroyed
+            self._poll_id = None
+
+        self._pool.shutdown(wait=wait, cancel_futures=True)
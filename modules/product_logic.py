@@ -2,14 +2,110 @@
 In this script only include code related to validation and bussiness logic
 """
 
+import math
+import os
 import sqlite3
+import threading
+from datetime import datetime, date, timedelta, timezone
+
+from modules.search_index import ProductNameIndex
+from modules.cache import ReferenceCache, ProductCache
+from modules.database_manager import MAX_ARCHIVED_YEARS
+from modules.snapshot import SalesSnapshot
+from modules.report_engine import ReportEngine
 
 class ProductLogic:
 
-    # Constructor
-    def __init__(self, db_manager):
+    # Constructor. product_cache_size: number of products kept in the LRU cache of the sale and stock paths.
+    # report_workers: processes used by the parallel sales reports (the number of cores by default)
+    def __init__(self, db_manager, product_cache_size=512, report_workers=None):
         self.db = db_manager
 
+        # In-memory index of product names for search-as-you-type. It is built the first time it is used
+        self.name_index = None
+        self._name_index_lock = threading.Lock()
+
+        # Cache of categories, suppliers and clients. The database drops a table from it on every insert or delete
+        self.ref_cache = ReferenceCache()
+        self.db.add_change_listener(self.ref_cache.on_database_change)
+
+        # LRU cache of the product rows used by process_sale and manual_update_stock
+        self.product_cache = ProductCache(product_cache_size)
+        self.db.add_change_listener(self.product_cache.on_database_change)
+
+        # Columnar snapshot of the sales for the analytics processes, in the snapshot folder next to the database
+        self.sales_snapshot = SalesSnapshot(os.path.join(os.path.dirname(self.db.db_path), 'snapshot'))
+
+        # Engine of the parallel sales reports. The worker processes are started the first time it is used
+        self.report_engine = ReportEngine(self.db, report_workers)
+
+    
+    # -- REFERENCE CACHE --
+
+    # Loaders used by the cache to read the whole tables
+    def _load_categories(self):
+        return self.db.get_categories_db().fetchall()
+
+    def _load_suppliers(self):
+        return self.db.get_suppliers_db().fetchall()
+
+    def _load_clients(self):
+        return self.db.get_clients_db().fetchall()
+
+    # Get the name -> ID map of a table with all the names. The cache only sees the writes of this process, so if a name is
+    # missing (another till could have added it) the table is read again once
+    def _reference_ids(self, table, names, loader):
+
+        ids = self.ref_cache.get_ids(table, loader)
+
+        if any(name and name not in ids for name in names):
+            self.ref_cache.invalidate(table)
+            ids = self.ref_cache.get_ids(table, loader)
+
+        return ids
+
+    # Get the ID of a category by name (None if it doesnt exist)
+    def _category_id(self, name):
+        return self._reference_ids('categories', [name], self._load_categories).get(name)
+
+    # Get the ID of a client by name (None if it doesnt exist)
+    def _client_id(self, name):
+        return self._reference_ids('clients', [name], self._load_clients).get(name)
+
+    # Load a product row by name for the product cache
+    def _load_product(self, name):
+        return self.db.search_product_db(name).fetchone()
+
+    # Get the row of a product by name (None if it doesnt exist)
+    def _get_product(self, name):
+        return self.product_cache.get(name, self._load_product)
+
+    # Write the stock of a product by name. write(product) makes the write with the ID of the product and must check its
+    # name too (see DatabaseManager._product_guard): if another till renamed or deleted the cached product nothing is
+    # written, and the product is read again from the database and written once more. Return the product (None if it doesnt exist)
+    def _write_product_stock(self, name, write):
+
+        product = self._get_product(name)
+
+        if product is None or write(product).rowcount:
+            return product
+
+        self.product_cache.invalidate(name)
+        product = self._get_product(name)
+
+        if product is None or write(product).rowcount:
+            return product
+
+        self.product_cache.invalidate(name)
+        return None
+
+    # Cache statistics function. Hits, misses, evictions and invalidations of the caches
+    def get_cache_stats(self):
+        return {
+            'reference': self.ref_cache.get_stats(),
+            'products': self.product_cache.get_stats(),
+        }
+
     
     # -- BUSSINESS LOGIC --
 
@@ -19,15 +115,58 @@ class ProductLogic:
         # Instead of use the query, we call the function in database manager with the self.db
         return self.db.search_product_db(search_term)
     
+    # Ranked search function. Every word typed is searched as a prefix in the name and description of the products,
+    # so "app gre" finds "Green apple". Return a list with the best matches first
+    def search_products(self, query, limit=50):
+
+        # Each word is quoted (the user cant write FTS5 syntax by mistake) and marked as prefix with *
+        words = [word.replace('"', '""') for word in (query or '').split()]
+
+        if not words:
+            return []
+
+        match = ' '.join('"{}"*'.format(word) for word in words)
+
+        return self.db.search_products_fts_db(match, limit).fetchall()
+    
+    # Suggest products function. Search-as-you-type: the names are found in the in-memory index and only the
+    # matching rows (at most limit) are read from the database. Return the rows in the order of the index
+    def suggest_products(self, prefix, limit=20):
+
+        # The lock avoids building it twice when called from several worker threads
+        with self._name_index_lock:
+
+            if self.name_index is None:
+
+                # Subscribe before loading, so no write is lost meanwhile
+                name_index = ProductNameIndex()
+                self.db.add_change_listener(name_index.on_database_change)
+                name_index.rebuild(row[0] for row in self.db.get_product_names_db())
+                self.name_index = name_index
+
+        names = self.name_index.search(prefix, limit)
+
+        if not names:
+            return []
+
+        rows = {row.name: row for row in self.db.get_products_by_names_db(names)}
+
+        return [rows[name] for name in names if name in rows]
+    
     # Get products function:
     def get_products(self):
 
         return self.db.get_products_db()
+
+    # Get product names function. Only the names, for the lists that dont need the rest of the columns
+    def get_product_names(self):
+
+        return [row[0] for row in self.db.get_product_names_db()]
     
     # Get categories function
     def get_categories(self):
 
-        db_rows = self.db.get_categories_db()
+        db_rows = self.ref_cache.get_rows('categories', self._load_categories)
 
         # For loop to get all the categories
         try:
@@ -49,8 +188,12 @@ class ProductLogic:
         # Validate if price input has a valid number
         try:
             price_value = float(price)
-        except ValueError as ve:
+        except (TypeError, ValueError):
+
+            return False, 'Price input must be a valid number.'
 
+        # 'nan' and 'inf' are valid floats, but not valid prices
+        if not math.isfinite(price_value):
             return False, 'Price input must be a valid number.'
         
         # Validate if price input has a positive value
@@ -71,12 +214,9 @@ class ProductLogic:
         name_normalized = name.capitalize()
         
         # 3. Look for the category_id record in the categories table
-        res_cat = self.db.get_category_id_by_name_db(category_name)
-        
         try:
 
-            row = res_cat.fetchone()
-            category_id = row[0] if row else 1 # Use ID 1 if it doesnt find anything
+            category_id = self._category_id(category_name) or 1 # Use ID 1 if it doesnt find anything
 
         except Exception:
             category_id = 1
@@ -92,6 +232,77 @@ class ProductLogic:
             
             return False, 'Product {} already exists (Database Error).'.format(name_normalized)
                 
+    # Import products function. Load a whole catalogue at once.
+    # rows: iterable of (name, price, stock, category_name). category_name is optional ('General' if it doesnt exist).
+    # Invalid rows dont stop the import. Return the number of imported products and a list of (row_number, error message)
+    def import_products(self, rows):
+
+        rows = list(rows)
+        errors = []
+        valid_rows = []
+        row_numbers = {}
+
+        # 1. Resolve all the category names with a single query
+        category_names = {row[3] for row in rows if isinstance(row, (list, tuple)) and len(row) > 3 and isinstance(row[3], str)}
+        categories = self._reference_ids('categories', category_names, self._load_categories)
+
+        # 2. Validation and normalization of every row
+        for row_number, row in enumerate(rows, start=1):
+
+            try:
+                name, price, stock = row[0], row[1], row[2]
+                category_name = row[3] if len(row) > 3 else None
+            except (TypeError, IndexError):
+                errors.append((row_number, 'Row must have name, price and stock.'))
+                continue
+
+            if name is not None and not isinstance(name, str):
+                errors.append((row_number, 'Name must be text.'))
+                continue
+
+            is_valid, error_msg = self.validation(name, price)
+            if not is_valid:
+                errors.append((row_number, error_msg))
+                continue
+
+            try:
+                stock = int(stock)
+            except (TypeError, ValueError):
+                errors.append((row_number, 'Stock must be a valid integer number.'))
+                continue
+
+            if stock < 0:
+                errors.append((row_number, 'Stock quantity cannot be negative.'))
+                continue
+
+            name_normalized = name.capitalize()
+
+            # Duplicated inside the same file
+            if name_normalized in row_numbers:
+                errors.append((row_number, 'Product {} is duplicated in row {}.'.format(name_normalized, row_numbers[name_normalized])))
+                continue
+
+            row_numbers[name_normalized] = row_number
+            category_id = categories.get(category_name, 1) # Use ID 1 if it doesnt find anything
+            valid_rows.append((name_normalized, float(price), stock, category_id))
+
+        # 3. Insert all the valid rows in one transaction
+        if not valid_rows:
+            return 0, errors
+
+        try:
+            imported, existing_names = self.db.insert_products_bulk(valid_rows)
+        except sqlite3.Error as e:
+            errors.append((None, 'Import cancelled (Database Error): {}'.format(e)))
+            return 0, errors
+
+        for name in existing_names:
+            errors.append((row_numbers[name], 'Product {} already exists.'.format(name)))
+
+        errors.sort(key=lambda error: error[0] or 0)
+
+        return imported, errors
+
     # Delete product function
     def delete_product(self, name):
         try:
@@ -136,38 +347,113 @@ class ProductLogic:
 
             return False, 'Stock must be a valid integer number.'
         
-        # 2. Get Product ID
-        res = self.db.search_product_db(product_name)
-        product = res.fetchone()
-
-        if not product:
-            return False, 'Product not found.'
+        # 2. Update stock in DB (the ID comes from the product cache)
+        try:
+            product = self._write_product_stock(
+                product_name, lambda product: self.db.update_product_stock_db(product.id, new_stock, product.name)
+            )
 
-        prod_id = product[0] 
+            if not product:
+                return False, 'Product not found.'
 
-        # 3. Update stock in DB
-        try:
-            self.db.update_product_stock_db(prod_id, new_stock)
             return True, f'Stock for product "{product_name}" successfully updated to {new_stock}.'
         
         except Exception as e:
 
             return False, f'Error updating stock: {e}'
+
+
+    # -- STOCK MOVEMENTS --
+    # Every change of stock is recorded in the stock_movements ledger by the database manager (sales, manual adjustments,
+    # imports and returns). Snapshots of the whole stock are saved periodically to answer "stock at a date" quickly.
+
+    # Return function. Put back in stock the units returned by a client
+    def return_product(self, product_name, quantity):
+
+        try:
+            qty = int(quantity)
+        except (TypeError, ValueError):
+            return False, 'Quantity must be a valid integer number.'
+
+        if qty <= 0:
+            return False, 'Quantity must be positive.'
+
+        try:
+            product = self._write_product_stock(
+                product_name, lambda product: self.db.increment_product_stock_db(product.id, qty, 'return', product.name)
+            )
+
+            if not product:
+                return False, 'Product not found.'
+
+            return True, f'{qty} units of "{product_name}" returned to stock.'
+
+        except sqlite3.Error as e:
+            return False, f'Error returning the product: {e}'
+
+    # Function to get the last stock movements of a product: (id, date, kind, quantity) rows, the newest first
+    # (the product is read from the database: a cached ID could belong to another product now)
+    def get_stock_history(self, product_name, limit=100):
+
+        product = self._load_product(product_name)
+
+        if not product:
+            return []
+
+        return self.db.get_stock_movements_db(product.id, limit).fetchall()
+
+    # Function to get the stock at a date (date, datetime or 'YYYY-MM-DD[ HH:MM:SS]' string, in UTC like the sales).
+    # With product_name return the stock of that product (None if it doesnt exist), without it a dict {product_id: stock}
+    def get_stock_as_of(self, when, product_name=None):
+
+        as_of = self._to_datetime(when).strftime('%Y-%m-%d %H:%M:%S')
+
+        if product_name is None:
+            return dict(self.db.get_stock_as_of_db(as_of))
+
+        product = self._load_product(product_name)
+
+        if not product:
+            return None
+
+        rows = self.db.get_stock_as_of_db(as_of, product.id)
+
+        return rows[0][1] if rows else None
+
+    # Snapshot function. Save the stock of the products that changed since the last snapshot if the newest snapshot is
+    # older than max_age_hours (0 = always)
+    def snapshot_stock(self, max_age_hours=24):
+
+        try:
+            last_date = self.db.get_last_stock_snapshot_date_db()
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+            if last_date and now - self._to_datetime(last_date) < timedelta(hours=max_age_hours):
+                return False, 'Stock snapshot not needed yet.'
+
+            count = self.db.create_stock_snapshot_db()
+            return True, f'Stock snapshot saved for {count} products.'
+
+        except sqlite3.Error as e:
+            return False, f'Error saving the stock snapshot: {e}'
     
 
     # Function to filter the products depends of the search.
-    def filter_products(self, category_name, only_active):
+    # Without limit it returns every product (cursor). With limit it returns only one page, ordered by name:
+    # (rows, total, next_after_name). Pass next_after_name as after_name to get the next page, it is None in the last page.
+    # before_name returns the page just before that name instead (to scroll backwards)
+    def filter_products(self, category_name, only_active, limit=None, after_name=None, before_name=None):
+
+        if limit is not None:
+            return self.filter_products_page(category_name, only_active, limit, after_name, before_name)
 
         # Case 1: If exists the selected category (which is not 'All')
         if category_name and category_name != 'All':
 
             # Get the Category_ID
-            res = self.db.get_category_id_by_name_db(category_name)
-            cat_data = res.fetchone()
-
-            if cat_data:
+            cat_id = self._category_id(category_name)
 
-                cat_id = cat_data[0]
+            if cat_id is not None:
 
                 # If we want only active too
                 if only_active:
@@ -190,10 +476,32 @@ class ProductLogic:
 
                 return self.db.get_products_db() # Return everything
 
+    # Function to get a single page of filtered products (keyset pagination)
+    def filter_products_page(self, category_name, only_active, limit, after_name=None, before_name=None):
+
+        cat_id = None
+
+        if category_name and category_name != 'All':
+
+            # Get the Category_ID
+            cat_id = self._category_id(category_name)
+
+            if cat_id is None:
+                return [], 0, None
+
+        rows = self.db.get_products_page_db(limit, after_name, cat_id, bool(only_active), before_name)
+
+        # Count only once, when the first page is requested
+        total = self.db.count_products_db(cat_id, bool(only_active)) if after_name is None and before_name is None else None
+
+        next_after_name = rows[-1].name if len(rows) == limit else None
+
+        return rows, total, next_after_name
+
     # -- CATEGORIES -- 
     # Get all categories function
     def get_all_categories(self):
-        return self.db.get_categories_db()
+        return self.ref_cache.get_rows('categories', self._load_categories)
     
 
     # Add category function
@@ -238,7 +546,7 @@ class ProductLogic:
     # -- SUPPLIERS -- 
     # Get all suppliers function
     def get_all_suppliers(self):
-        return self.db.get_suppliers_db()
+        return self.ref_cache.get_rows('suppliers', self._load_suppliers)
     
 
     # Add supplier function
@@ -290,75 +598,382 @@ class ProductLogic:
 
     # Process a sales function. 
     """
-    Process a complete sale:
+    Process a complete sale in a single transaction:
     1- Look for the product and clients IDs.
-    2- Check stock
+    2- Subtract stock only if there is enough (conditional UPDATE, safe with several tills)
     3- Calculate the discounted price.
-    4- Save a sale and subtract stock
+    4- Save the sale
 
+    If anything fails, the transaction is rolled back and neither the sale nor the stock change are saved.
     """
 
     def process_sale(self, product_name, client_name, quantity, discount_percent, payment_method):
         try:
 
-            # 1. Get the data of the product
-            res = self.db.search_product_db(product_name)
-            product = res.fetchone()
-
-            if not product:
-                return False, "Product not found."
-            
-
-            prod_id, prod_price, current_stock = product[0], product[2], product[3]
-
-            # 2. Check Stock
+            # 1. Check quantity
             qty = int(quantity)
 
             if qty <= 0:
                 return False, 'Quantity must be positive.'
-            
-            if current_stock < qty:
-                return False, "Insuficient stock. Only {} available.".format(current_stock)
-            
 
-            # 3. Get Client ID. 
-            res_client = self.db.get_client_id_by_name_db(client_name)
-            client_data = res_client.fetchone()
+            with self.db.transaction():
 
-            # If client doesnt found, take the 1 (Model Client).
-            client_id = client_data[0] if client_data else 1
-            
+                # 2. Get the data of the product from the cache
+                product = self._get_product(product_name)
+
+                if not product:
+                    return False, "Product not found."
+
+                # 3. Subtract stock. The update checks the cached name and price too, so if no row is updated there was not
+                # enough stock or another till changed the product. Nothing has been written yet: read it again and retry once
+                cursor = self.db.decrement_product_stock_db(product.id, qty, product.name, product.price)
+
+                if cursor.rowcount == 0:
+                    self.product_cache.invalidate(product_name)
+                    product = self._get_product(product_name)
+
+                    if not product:
+                        return False, "Product not found."
+
+                    cursor = self.db.decrement_product_stock_db(product.id, qty, product.name, product.price)
+
+                    if cursor.rowcount == 0:
+                        return False, "Insuficient stock. Only {} available.".format(product.stock)
 
-            # 4. Calculate the total.
-            total = prod_price * qty
-            final_total = total * (1 - (discount_percent / 100))
+                prod_id, prod_price = product.id, product.price
 
-            # 5. Transaction (Insert a sale + Update stock)
-            self.db.insert_sales_db(prod_id, client_id, qty, final_total, payment_method)
+                # 4. Get Client ID. 
+                # If client doesnt found, take the 1 (Model Client).
+                client_id = self._client_id(client_name) or 1
 
-            new_stock = current_stock - qty
-            self.db.update_product_stock_db(prod_id, new_stock)
+                # 5. Calculate the total.
+                total = prod_price * qty
+                final_total = total * (1 - (discount_percent / 100))
+
+                # 6. Save the sale in the same transaction
+                self.db.insert_sales_db(prod_id, client_id, qty, final_total, payment_method)
 
             return True, f"Sale successful! Total: ${final_total:.2f}"
         
         except Exception as e:
             return False, f"Error processing sale: {e}"
         
+    # Process a batch of sales function. Used to replay the sales queued by a till while it was offline.
+    """
+    sales: iterable of dicts with the keys of SalesPanel.get_sale_data() (product_name, client_name, quantity, discount, payment_method)
+    and an optional 'date' with the original timestamp of the sale (datetime or ISO string, UTC if it has no time zone).
+    A sale with a date that cannot be read is rejected.
+
+    The sales are applied in order with the same rules as process_sale (a sale without enough stock is rejected and
+    the next ones can still be accepted), but with one query for all the products, one for all the clients,
+    executemany for the stock and the sales and a single commit.
+    Return a list with a (success, message) tuple for every sale.
+    """
+
+    def process_sales_batch(self, sales):
+
+        sales = list(sales)
+        results = [None] * len(sales)
+
+        try:
+
+            with self.db.transaction():
+
+                # 1. Resolve all the products at once (the clients come from the reference cache)
+                product_names = {sale.get('product_name') for sale in sales}
+
+                products = {row.name: row for row in self.db.get_products_by_names_db(product_names)}
+                clients = self._reference_ids('clients', {sale.get('client_name') for sale in sales}, self._load_clients)
+
+                # Stock available while the batch is applied. The transaction holds the write lock, nobody else can change it
+                stock = {row.id: row.stock for row in products.values()}
+                sold = {}
+                sales_rows = []
+
+                # 2. Check every sale in order
+                for i, sale in enumerate(sales):
+
+                    try:
+                        qty = int(sale.get('quantity'))
+                        discount_percent = float(sale.get('discount', 0) or 0)
+                    except (TypeError, ValueError) as e:
+                        results[i] = (False, f"Error processing sale: {e}")
+                        continue
+
+                    if qty <= 0:
+                        results[i] = (False, 'Quantity must be positive.')
+                        continue
+
+                    # The reports compare the dates as text, so they are saved in the same format as CURRENT_TIMESTAMP
+                    sale_date = sale.get('date')
+
+                    if sale_date is not None:
+                        try:
+                            sale_date = self._to_datetime(sale_date).strftime('%Y-%m-%d %H:%M:%S')
+                        except (TypeError, ValueError):
+                            results[i] = (False, 'Invalid sale date {!r}.'.format(sale_date))
+                            continue
+
+                    product = products.get(sale.get('product_name'))
+
+                    if not product:
+                        results[i] = (False, "Product not found.")
+                        continue
+
+                    prod_id, prod_price = product.id, product.price
+
+                    if stock[prod_id] < qty:
+                        results[i] = (False, "Insuficient stock. Only {} available.".format(stock[prod_id]))
+                        continue
+
+                    stock[prod_id] -= qty
+                    sold[prod_id] = sold.get(prod_id, 0) + qty
+
+                    # If client doesnt found, take the 1 (Model Client).
+                    client_id = clients.get(sale.get('client_name'), 1)
+
+                    final_total = prod_price * qty * (1 - (discount_percent / 100))
+
+                    sales_rows.append((prod_id, client_id, qty, final_total, sale.get('payment_method'), sale_date))
+                    results[i] = (True, f"Sale successful! Total: ${final_total:.2f}")
+
+                # 3. Subtract the stock (one row per product) and save all the sales
+                if sold:
+                    cursor = self.db.decrement_products_stock_bulk_db(sold.items())
+
+                    if cursor.rowcount != len(sold):
+                        raise sqlite3.DatabaseError('Stock changed while the batch was processed.')
+
+                    self.db.insert_sales_bulk_db(sales_rows)
+
+        except Exception as e:
+
+            # Nothing has been saved
+            return [(False, f"Error processing sale: {e}")] * len(sales)
+
+        return results
+
     # Function to get sales grouped by category
     def get_sales_by_category(self):
         return self.db.get_sales_by_category_db()
+
+    # Function to recalculate the sales totals used by the dashboard and the time range reports
+    def rebuild_sales_totals(self):
+
+        try:
+            self.db.rebuild_category_sales_totals_db()
+            self.db.rebuild_sales_rollups_db()
+            return True, 'Sales totals rebuilt successfully.'
+
+        except sqlite3.Error as e:
+            return False, f'Error rebuilding sales totals: {e}'
     
+    # Archive function. Move the sales of the closed years to one archive file per year and compact the live database.
+    # keep_years: years kept in the live database, counting the current one. The reports keep showing the archived sales
+    def archive_sales(self, keep_years=1, vacuum=True):
+
+        last_closed_year = datetime.now().year - max(int(keep_years), 1)
+
+        try:
+            years = [year for year in self.db.get_sales_years_db() if year <= last_closed_year]
+
+            if not years:
+                return False, 'There are no closed years to archive.'
+
+            # Check the limit before moving anything, so the job never stops in the middle
+            archived = self.db.get_archived_years_db()
+            new_years = [year for year in years if year not in archived]
+
+            if len(archived) + len(new_years) > MAX_ARCHIVED_YEARS:
+                return False, (
+                    f'Cannot archive {", ".join(str(year) for year in new_years)}: at most {MAX_ARCHIVED_YEARS} years can be archived '
+                    f'and {len(archived)} already are. Keep more years in the live database.'
+                )
+
+            moved = sum(self.db.archive_sales_year_db(year) for year in years)
+
+            if vacuum:
+                self.db.vacuum_db()
+
+            return True, f'{moved} sales archived ({", ".join(str(year) for year in years)}).'
+
+        except (sqlite3.Error, ValueError) as e:
+            return False, f'Error archiving sales: {e}'
+
+    # Export function. Append the new sales to the columnar snapshot (full=True writes it again from zero, needed after
+    # deleting or changing exported sales). The analytics processes read the snapshot instead of the live database
+    def export_sales_snapshot(self, full=False):
+
+        try:
+            exported = self.sales_snapshot.export(self.db, full=full)
+            return True, f'{exported} sales exported to the analytics snapshot.'
+
+        except (sqlite3.Error, OSError) as e:
+            return False, f'Error exporting the sales snapshot: {e}'
+
+    # Convert a date, datetime or ISO 'YYYY-MM-DD[ HH:MM:SS]' string to datetime (naive, in UTC like the sales).
+    # Raise ValueError if it is not a valid date
+    def _to_datetime(self, value):
+
+        if isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc)
+
+            return value.replace(microsecond=0, tzinfo=None)
+
+        if isinstance(value, date):
+            return datetime(value.year, value.month, value.day)
+
+        if not isinstance(value, str):
+            raise ValueError('Invalid date {!r}.'.format(value))
+
+        return self._to_datetime(datetime.fromisoformat(value.strip()))
+
+    # Split a date range in the pieces each source can answer: whole days from the daily rollup, whole hours from the
+    # hourly rollup and only the minutes at the edges from the raw sales. Return a list of (grain, start, end)
+    def plan_sales_summary(self, start, end):
+
+        start, end = self._to_datetime(start), self._to_datetime(end)
+
+        if start >= end:
+            return []
+
+        first_hour = start.replace(minute=0, second=0)
+        if first_hour < start:
+            first_hour += timedelta(hours=1)
+
+        last_hour = end.replace(minute=0, second=0)
+
+        # Less than one whole hour: everything from the raw sales
+        if first_hour >= last_hour:
+            return [(None, start, end)]
+
+        first_day = first_hour.replace(hour=0)
+        if first_day < first_hour:
+            first_day += timedelta(days=1)
+
+        last_day = last_hour.replace(hour=0)
+
+        if first_day >= last_day:
+            pieces = [(None, start, first_hour), ('hour', first_hour, last_hour), (None, last_hour, end)]
+        else:
+            pieces = [
+                (None, start, first_hour),
+                ('hour', first_hour, first_day),
+                ('day', first_day, last_day),
+                ('hour', last_day, last_hour),
+                (None, last_hour, end),
+            ]
+
+        return [(grain, piece_start, piece_end) for grain, piece_start, piece_end in pieces if piece_start < piece_end]
+
+    # Function to get a sales summary between two dates (start included, end excluded).
+    # group_by: 'product', 'category', 'payment_method' or None (one total row).
+    # The coarsest rollups that cover the range are used, so a year costs a few hundred days of rows instead of every sale.
+    # Return (key, units, revenue, sales_count) rows, the highest revenue first
+    def get_sales_summary(self, start, end, group_by=None):
+
+        totals = {}
+
+        for grain, piece_start, piece_end in self.plan_sales_summary(start, end):
+
+            rows = self.db.get_sales_summary_db(
+                piece_start.strftime('%Y-%m-%d %H:%M:%S'),
+                piece_end.strftime('%Y-%m-%d %H:%M:%S'),
+                group_by,
+                grain
+            )
+
+            for key, units, revenue, sales_count in rows:
+                current = totals.get(key, (0, 0.0, 0))
+                totals[key] = (current[0] + (units or 0), current[1] + (revenue or 0), current[2] + (sales_count or 0))
+
+        summary = [(key, units, revenue, sales_count) for key, (units, revenue, sales_count) in totals.items() if sales_count]
+        summary.sort(key=lambda row: row[2], reverse=True)
+
+        return summary
+
+    # Function to get a sales summary from the raw sales (archives included) in parallel: the range is split in shards and
+    # every shard is summed by a worker process (see ReportEngine). Same arguments and rows as get_sales_summary,
+    # for the reports the rollups cannot answer or to check them
+    def get_sales_summary_parallel(self, start, end, group_by=None):
+
+        return self.report_engine.sales_summary(self._to_datetime(start), self._to_datetime(end), group_by)
+
+    # Close function. Stop the worker processes of the reports
+    def close(self):
+
+        self.report_engine.close()
+
+    # Function to get the analytics of every product in the last days: units, revenue, velocity, days of cover, ABC class...
+    # (see SalesAnalytics.analyze). end: last day excluded, tomorrow by default (today included).
+    # Return (True, dict of NumPy arrays) or (False, message). NumPy is only needed here, the rest of the application works without it
+    def get_product_analytics(self, days=90, end=None):
+
+        try:
+            from modules.analytics import SalesAnalytics
+        except ImportError:
+            return False, 'NumPy is required for the sales analytics.'
+
+        end_day = self._to_datetime(end).date() if end is not None else datetime.now(timezone.utc).date() + timedelta(days=1)
+        start_day = end_day - timedelta(days=int(days))
+
+        try:
+            return True, SalesAnalytics(self.db).analyze(start_day, end_day)
+
+        except sqlite3.Error as e:
+            return False, f'Error calculating the analytics: {e}'
+
     # Function to get the sales report
     def get_sales_report(self):
 
         return self.db.get_sales_report_db().fetchall()
+
+    # Function to get one page of the sales report (newest first).
+    # cursor is the value returned with the previous page (None for the first one). Return (rows, next_cursor), next_cursor is None at the end
+    def get_sales_report_page(self, limit, cursor=None):
+
+        after_date, after_id = cursor if cursor else (None, None)
+
+        rows = self.db.get_sales_report_page_db(limit, after_date, after_id).fetchall()
+
+        next_cursor = (rows[-1].date, rows[-1].id) if len(rows) == limit else None
+
+        return rows, next_cursor
+
+    # Function to stream the whole sales report without loading it in memory.
+    # Every page is a short query (keyset on date and id), so no read transaction stays open while the caller works.
+    # Rows are read from each page in chunks of chunk_size with fetchmany
+    def iter_sales_report(self, page_size=5000, chunk_size=500):
+
+        after_date, after_id = None, None
+
+        while True:
+
+            cursor = self.db.get_sales_report_page_db(page_size, after_date, after_id)
+            count = 0
+            last_row = None
+
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    break
+
+                count += len(chunk)
+                last_row = chunk[-1]
+                yield from chunk
+
+            if count < page_size:
+                return
+
+            after_date, after_id = last_row.date, last_row.id
     
 
     # -- CLIENTS LOGIC --
 
     # Get all clients
     def get_all_clients(self):
-        return self.db.get_clients_db().fetchall()
+        return list(self.ref_cache.get_rows('clients', self._load_clients))
     
     # Add client
     def add_client(self, name, email, notes):
@@ -0,0 +1,83 @@
+"""
+In this script only include the record types used to pass rows between the database, the bussiness logic and the UI
+"""
+
+
+# RECORD
+# Base of the row records. Every record class lists its fields in __slots__, in the same order as the columns of its SELECT,
+# so the instances have no __dict__ and weigh like a tuple of the same fields, but the code reads row.name instead of row[1].
+# The database creates them directly with the row factory: run_query(query, parameters, record=ProductRecord)
+class Record:
+
+    __slots__ = ()
+
+    # Row factory for sqlite3 (cursor.row_factory)
+    @classmethod
+    def from_row(cls, cursor, row):
+        return cls(*row)
+
+    # Columns of the SELECT that fills the record. alias: table alias used in the query ('p' -> 'p.id, p.name...')
+    @classmethod
+    def columns(cls, alias=None):
+
+        if alias is None:
+            return ', '.join(cls.__slots__)
+
+        return ', '.join('{}.{}'.format(alias, name) for name in cls.__slots__)
+
+    # Replace function. Return a copy of the record with some fields changed (the records are never changed in place,
+    # they can be shared by the caches and several threads)
+    def replace(self, **changes):
+
+        values = [changes.pop(name, getattr(self, name)) for name in self.__slots__]
+
+        if changes:
+            raise TypeError('Unknown fields: {}'.format(', '.join(changes)))
+
+        return type(self)(*values)
+
+    # Values of the record as a tuple, in column order
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+
+        if type(other) is not type(self):
+            return NotImplemented
+
+        return self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+# PRODUCT RECORD
+# The columns of a product used by the lists, the searches and the sales. The description and the supplier are not read
+class ProductRecord(Record):
+
+    __slots__ = ('id', 'name', 'price', 'stock', 'category_id')
+
+    def __init__(self, id, name, price, stock, category_id):
+        self.id = id
+        self.name = name
+        self.price = price
+        self.stock = stock
+        self.category_id = category_id
+
+
+# SALE RECORD
+# A row of the sales report, with the names of the product and the client
+class SaleRecord(Record):
+
+    __slots__ = ('id', 'product', 'client', 'quantity', 'total', 'date')
+
+    def __init__(self, id, product, client, quantity, total, date):
+        self.id = id
+        self.product = product
+        self.client = client
+        self.quantity = quantity
+        self.total = total
+        self.date = date
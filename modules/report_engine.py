@@ -0,0 +1,231 @@
+"""
+In this script only include the parallel report engine. A big sales report is split in date ranges (shards), every shard is
+aggregated by a worker process with its own read-only connection, and the partial results are merged
+"""
+
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from urllib.request import pathname2url
+
+from modules.database_manager import SALES_SUMMARY_GROUPS
+
+
+# Shards created for every worker. More shards than workers keep all the workers busy when some ranges have more sales
+SHARDS_PER_WORKER = 4
+
+# The shards are never shorter than this
+MIN_SHARD_LENGTH = timedelta(hours=1)
+
+# Archives attached at the same time by a worker (SQLite allows 10 attached databases by default)
+MAX_ATTACHED_ARCHIVES = 8
+
+# Partial aggregate of one shard in one database (main or an archive)
+SHARD_QUERY = '''
+    SELECT {key} AS summary_key, SUM(r.quantity), SUM(r.total_price), COUNT(*)
+    FROM {schema}.sales r
+    LEFT JOIN main.products p ON r.product_id = p.id
+    LEFT JOIN main.categories c ON p.category_id = c.id
+    WHERE r.date >= ? AND r.date < ?
+    GROUP BY summary_key
+'''
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# -- WORKER --
+# These functions run in the worker processes (or in the calling thread when there is only one worker)
+
+# Read-only connections of the worker processes, by database path. SQLite connections cannot be shared between
+# threads, so every thread has its own dict
+_local = threading.local()
+
+
+# URI to open a database file in read-only mode
+def _read_only_uri(path):
+    return 'file:{}?mode=ro'.format(pathname2url(os.path.abspath(path)))
+
+
+# Open a read-only connection to a database
+def open_read_only(db_path):
+
+    conn = sqlite3.connect(_read_only_uri(db_path), uri=True)
+    conn.execute('PRAGMA query_only = 1')
+
+    return conn
+
+
+# Get the read-only connection of this thread to a database (kept open for the next shards of the worker)
+def _get_connection(db_path):
+
+    connections = getattr(_local, 'connections', None)
+
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+
+    if conn is None:
+        conn = connections[db_path] = open_read_only(db_path)
+
+    return conn
+
+
+# Attach an archive (read-only) to a connection if it is not attached yet. Return its schema name
+def _attach_archive(conn, year, path):
+
+    alias = 'archive_{}'.format(int(year))
+    attached = [row[1] for row in conn.execute('PRAGMA database_list') if row[1].startswith('archive_')]
+
+    if alias in attached:
+        return alias
+
+    # The shards never cross a year, so the archives of other years are not needed anymore
+    if len(attached) >= MAX_ATTACHED_ARCHIVES:
+        for name in attached:
+            conn.execute('DETACH DATABASE {}'.format(name))
+
+    conn.execute('ATTACH DATABASE ? AS {}'.format(alias), (_read_only_uri(path),))
+
+    return alias
+
+
+# Aggregate the sales between start (included) and end (excluded) of the live database and of the archive of that year
+# (archive is (year, path) or None) with a connection. Return (key, units, revenue, sales_count) rows
+def _summarize(conn, archive, group_by, start, end):
+
+    schemas = ['main']
+
+    if archive is not None:
+        schemas.append(_attach_archive(conn, *archive))
+
+    totals = {}
+
+    for schema in schemas:
+        query = SHARD_QUERY.format(key=SALES_SUMMARY_GROUPS[group_by], schema=schema)
+
+        for key, units, revenue, sales_count in conn.execute(query, (start, end)):
+            current = totals.get(key, (0, 0.0, 0))
+            totals[key] = (current[0] + (units or 0), current[1] + (revenue or 0), current[2] + sales_count)
+
+    return [(key, units, revenue, sales_count) for key, (units, revenue, sales_count) in totals.items()]
+
+
+# Summarize shard function. Run in the worker processes: aggregate one shard with the connection kept by the worker
+def summarize_shard(db_path, archive, group_by, start, end):
+
+    return _summarize(_get_connection(db_path), archive, group_by, start, end)
+
+
+# REPORT ENGINE
+# Runs the sales reports over the raw sales (archives included) in a pool of processes, so a year-end report uses all
+# the cores instead of one. The pool is created the first time it is used and kept until close().
+# The workers are started with 'spawn': the application has threads running, and a forked child could inherit a lock held by one of them
+class ReportEngine:
+
+    # Constructor. workers: number of worker processes (the number of cores by default). With 1 worker everything
+    # runs in the calling process, without a pool
+    def __init__(self, db_manager, workers=None):
+        self.db = db_manager
+        self.workers = max(int(workers or os.cpu_count() or 1), 1)
+
+        self._pool = None
+        self._lock = threading.Lock()
+
+    # Get the process pool, creating it if needed
+    def _get_pool(self):
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+
+            return self._pool
+
+    # Close function. Stop the worker processes
+    def close(self):
+
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    # Plan shards function. Split the range between start and end (datetimes, end excluded) in about workers * SHARDS_PER_WORKER
+    # ranges. The ranges never cross a year, so every shard reads at most one archive. Return a list of (start, end)
+    def plan_shards(self, start, end):
+
+        if start >= end:
+            return []
+
+        # First cut the range at the start of every year
+        pieces = []
+        piece_start = start
+
+        while piece_start < end:
+            next_year = datetime(piece_start.year + 1, 1, 1)
+            pieces.append((piece_start, min(next_year, end)))
+            piece_start = next_year
+
+        # Then split every year in shards, as many as its share of the whole range
+        total_length = end - start
+        wanted = self.workers * SHARDS_PER_WORKER
+        shards = []
+
+        for piece_start, piece_end in pieces:
+            length = piece_end - piece_start
+            count = max(1, min(round(wanted * (length / total_length)), int(length / MIN_SHARD_LENGTH)))
+            step = length / count
+
+            for number in range(count):
+                shard_start = piece_start + step * number
+                shard_end = piece_end if number == count - 1 else piece_start + step * (number + 1)
+                shards.append((shard_start.replace(microsecond=0), shard_end.replace(microsecond=0)))
+
+        return [(shard_start, shard_end) for shard_start, shard_end in shards if shard_start < shard_end]
+
+    # Sales summary function. Sum units, revenue and number of sales between start and end (datetimes, end excluded) grouped
+    # by product, category, payment_method or nothing (see SALES_SUMMARY_GROUPS).
+    # Return (key, units, revenue, sales_count) rows, the highest revenue first
+    def sales_summary(self, start, end, group_by=None):
+
+        if group_by not in SALES_SUMMARY_GROUPS:
+            raise ValueError('Unknown sales summary group "{}".'.format(group_by))
+
+        archives = {row[0]: self.db.get_archive_path(row[0]) for row in self.db.get_sales_archives_db()}
+
+        jobs = [
+            (
+                self.db.db_path,
+                (shard_start.year, archives[shard_start.year]) if shard_start.year in archives else None,
+                group_by,
+                shard_start.strftime(DATE_FORMAT),
+                shard_end.strftime(DATE_FORMAT),
+            )
+            for shard_start, shard_end in self.plan_shards(start, end)
+        ]
+
+        # In the calling thread, with a connection only for this call: the engine can be used from any thread
+        if self.workers == 1 or len(jobs) <= 1:
+            conn = open_read_only(self.db.db_path)
+
+            try:
+                partials = [_summarize(conn, *job[1:]) for job in jobs]
+            finally:
+                conn.close()
+
+        else:
+            partials = self._get_pool().map(summarize_shard, *zip(*jobs))
+
+        totals = {}
+
+        for rows in partials:
+            for key, units, revenue, sales_count in rows:
+                current = totals.get(key, (0, 0.0, 0))
+                totals[key] = (current[0] + units, current[1] + revenue, current[2] + sales_count)
+
+        summary = [(key, units, revenue, sales_count) for key, (units, revenue, sales_count) in totals.items()]
+        summary.sort(key=lambda row: row[2], reverse=True)
+
+        return summary
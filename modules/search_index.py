@@ -0,0 +1,131 @@
+"""
+In this script only include in-memory indexes used to answer searches without querying SQLite
+"""
+
+import threading
+from bisect import bisect_left, insort
+
+
+# PRODUCT NAME INDEX
+# Sorted list of (word, name) pairs, one pair for every word of every product name, all in lowercase.
+# A prefix search is a binary search to the first word >= prefix and a walk while the words still start with the prefix,
+# so "app" finds "Apple pie" and "Green apple" in O(log n) without touching the database.
+class ProductNameIndex:
+
+    # Constructor
+    def __init__(self, names=()):
+        self._lock = threading.Lock()
+        self._entries = []
+        self.rebuild(names)
+
+    # Split a name into the keys of the index
+    def _keys(self, name):
+
+        return {word for word in str(name).lower().split()}
+
+    # Rebuild function. Replace the whole content of the index (sorting once is much faster than inserting one by one)
+    def rebuild(self, names):
+
+        entries = [(word, name) for name in names for word in self._keys(name)]
+        entries.sort()
+
+        with self._lock:
+            self._entries = entries
+
+    # Add function. Insert new product names keeping the list sorted
+    def add(self, names):
+
+        entries = [(word, name) for name in names for word in self._keys(name)]
+
+        with self._lock:
+
+            # For big batches it is cheaper to sort everything again
+            if len(entries) > 1000:
+                self._entries.extend(entries)
+                self._entries.sort()
+            else:
+                for entry in entries:
+                    insort(self._entries, entry)
+
+    # Remove function. Delete product names from the index
+    def remove(self, names):
+
+        with self._lock:
+            for name in names:
+                for word in self._keys(name):
+                    i = bisect_left(self._entries, (word, name))
+                    if i < len(self._entries) and self._entries[i] == (word, name):
+                        del self._entries[i]
+
+    # Rename function. Used when a product changes its name
+    def rename(self, old_name, new_name):
+
+        self.remove([old_name])
+        self.add([new_name])
+
+    # Search function. Return up to limit product names with a word starting with prefix.
+    # Names that start with the prefix are returned first, then the rest, both in alphabetical order
+    def search(self, prefix, limit=20):
+
+        prefix = (prefix or '').strip().lower()
+
+        if not prefix:
+            return []
+
+        words = prefix.split()
+
+        starts = []
+        contains = []
+        seen = set()
+
+        with self._lock:
+
+            # Every word has a range of entries. Walk only the smallest one and check the other words in each candidate
+            ranges = [(bisect_left(self._entries, (word,)), bisect_left(self._entries, (word + '\uffff',)), word) for word in words]
+            start, end, index_word = min(ranges, key=lambda r: r[1] - r[0])
+            other_words = [word for word in words if word != index_word]
+
+            for i in range(start, end):
+
+                name = self._entries[i][1]
+
+                if name in seen:
+                    continue
+
+                seen.add(name)
+
+                if other_words:
+                    keys = self._keys(name)
+                    if not all(any(key.startswith(other) for key in keys) for other in other_words):
+                        continue
+
+                if name.lower().startswith(prefix):
+                    starts.append(name)
+                elif len(contains) < limit:
+                    contains.append(name)
+
+                if len(starts) >= limit:
+                    break
+
+        return (sorted(starts) + sorted(contains))[:limit]
+
+    # Number of names in the index
+    def __len__(self):
+
+        with self._lock:
+            return len({name for word, name in self._entries})
+
+    # Change listener for DatabaseManager.add_change_listener(). Keep the index equal to the products table
+    def on_database_change(self, table, action, data):
+
+        if table != 'products':
+            return
+
+        if action == 'insert':
+            self.add(data['names'])
+
+        elif action == 'delete':
+            self.remove(data['names'])
+
+        elif action == 'update':
+            self.rename(data['old_name'], data['new_name'])
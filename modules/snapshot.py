@@ -0,0 +1,264 @@
+"""
+In this script only include the columnar snapshot of the sales: a read-only copy for analytics and reporting processes,
+so they never open the live database
+"""
+
+import json
+import mmap
+import os
+import sys
+import time
+from array import array
+
+
+# Version of the files layout. A snapshot with another version is exported again from zero
+SNAPSHOT_VERSION = 1
+
+# Columns of the snapshot: (name, array typecode). Every column is one file of fixed-width little-endian values,
+# so a reader can map it and use it as an array without copying or parsing anything
+SALES_COLUMNS = (
+    ('id', 'q'),
+    ('product_id', 'q'),
+    ('client_id', 'q'),
+    ('quantity', 'q'),
+    ('total', 'd'),
+    ('date', 'q'),      # Unix time (seconds, UTC). 0 if the sale has no date
+    ('payment', 'h'),   # Code of the payment method, see meta['payment_methods']
+)
+
+PRODUCT_COLUMNS = (
+    ('id', 'q'),
+    ('price', 'd'),
+    ('stock', 'q'),
+    ('category_id', 'q'),
+)
+
+# NumPy dtype of every typecode (for numpy.memmap)
+NUMPY_DTYPES = {'q': '<i8', 'd': '<f8', 'h': '<i2'}
+
+# Sales read from the database in every fetchmany
+EXPORT_CHUNK_SIZE = 50000
+
+
+# SALES SNAPSHOT
+# Folder with one binary file per column and a meta.json that says how many rows are valid.
+# - export(db) appends only the sales with an id greater than the last exported one (incremental). The product columns
+#   are small and are written again every time. export(db, full=True) writes everything again.
+# - The meta is replaced atomically at the end of every export, and the readers only use the rows it counts, so a reader
+#   never sees half an export. The files of a full export have a new generation number, the old ones are removed after.
+# - The snapshot is append only: sales deleted or changed in the database after being exported need a full export.
+class SalesSnapshot:
+
+    # Constructor. folder: where the files are written
+    def __init__(self, folder):
+        self.folder = folder
+
+    # -- FILES --
+
+    def _meta_path(self):
+        return os.path.join(self.folder, 'meta.json')
+
+    def _column_path(self, table, column, number):
+        return os.path.join(self.folder, '{}_{}.{}.bin'.format(table, column, number))
+
+    # Read meta function. Return the meta dict of the snapshot, or None if there is no valid snapshot
+    def read_meta(self):
+
+        try:
+            with open(self._meta_path(), 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        return meta if meta.get('version') == SNAPSHOT_VERSION else None
+
+    # Write the meta in a temporary file and replace the old one in a single step
+    def _write_meta(self, meta):
+
+        temp_path = self._meta_path() + '.tmp'
+
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+
+        os.replace(temp_path, self._meta_path())
+
+    # Remove the files of the old generations (a reader on Windows can still have them open, they are removed next time)
+    def _remove_old_files(self, meta):
+
+        keep = {os.path.basename(self._column_path('sales', name, meta['generation'])) for name, typecode in SALES_COLUMNS}
+        keep |= {os.path.basename(self._column_path('products', name, meta['products_number'])) for name, typecode in PRODUCT_COLUMNS}
+
+        for file_name in os.listdir(self.folder):
+            if file_name.endswith('.bin') and file_name not in keep:
+                try:
+                    os.remove(os.path.join(self.folder, file_name))
+                except OSError:
+                    pass
+
+    # Write an array at the end of a file, always in little-endian
+    def _append_array(self, file, values):
+
+        if sys.byteorder != 'little':
+            values.byteswap()
+
+        values.tofile(file)
+
+    # -- EXPORT --
+
+    # Export function. Copy the new sales (and all the products) from the database to the snapshot.
+    # Return the number of sales appended
+    def export(self, db, full=False, chunk_size=EXPORT_CHUNK_SIZE):
+
+        os.makedirs(self.folder, exist_ok=True)
+
+        previous = self.read_meta()
+        full = full or previous is None
+
+        if full:
+            meta = {
+                'version': SNAPSHOT_VERSION,
+                'generation': (previous['generation'] + 1) if previous else 1,
+                'products_number': (previous['products_number'] + 1) if previous else 1,
+                'sales_rows': 0,
+                'last_sale_id': 0,
+                'payment_methods': [],
+            }
+
+            # New empty files for the new generation
+            for name, typecode in SALES_COLUMNS:
+                open(self._column_path('sales', name, meta['generation']), 'wb').close()
+
+        else:
+            meta = dict(previous)
+            meta['products_number'] = previous['products_number'] + 1
+
+            # Cut anything an interrupted export could have written after the last valid row
+            for name, typecode in SALES_COLUMNS:
+                with open(self._column_path('sales', name, meta['generation']), 'ab') as file:
+                    file.truncate(meta['sales_rows'] * array(typecode).itemsize)
+
+        appended = self._append_sales(db, meta, chunk_size)
+        self._write_products(db, meta)
+
+        meta['exported_at'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        self._write_meta(meta)
+        self._remove_old_files(meta)
+
+        return appended
+
+    # Append the sales with an id greater than meta['last_sale_id'] to the column files and update the meta
+    def _append_sales(self, db, meta, chunk_size):
+
+        payment_codes = {name: code for code, name in enumerate(meta['payment_methods'])}
+        files = {name: open(self._column_path('sales', name, meta['generation']), 'ab') for name, typecode in SALES_COLUMNS}
+        appended = 0
+
+        try:
+            cursor = db.get_sales_since_db(meta['last_sale_id'])
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+
+                if not rows:
+                    break
+
+                ids, product_ids, client_ids, quantities, totals, methods, dates = zip(*rows)
+
+                # Dictionary encoding of the payment methods: a small integer per sale instead of a string
+                for method in dict.fromkeys(methods):
+                    if method not in payment_codes:
+                        payment_codes[method] = len(payment_codes)
+                        meta['payment_methods'].append(method)
+
+                columns = {
+                    'id': ids,
+                    'product_id': product_ids,
+                    'client_id': client_ids,
+                    'quantity': quantities,
+                    'total': totals,
+                    'date': dates,
+                    'payment': [payment_codes[method] for method in methods],
+                }
+
+                for name, typecode in SALES_COLUMNS:
+                    self._append_array(files[name], array(typecode, columns[name]))
+
+                appended += len(rows)
+                meta['last_sale_id'] = ids[-1]
+
+        finally:
+            for file in files.values():
+                file.close()
+
+        meta['sales_rows'] += appended
+
+        return appended
+
+    # Write the product dimension (a new set of files every export) and the names of products and categories in the meta
+    def _write_products(self, db, meta):
+
+        rows = db.get_product_columns_db().fetchall()
+        ids, names, prices, stock, categories = zip(*rows) if rows else ((), (), (), (), ())
+
+        columns = {'id': ids, 'price': prices, 'stock': stock, 'category_id': categories}
+
+        for name, typecode in PRODUCT_COLUMNS:
+            with open(self._column_path('products', name, meta['products_number']), 'wb') as file:
+                self._append_array(file, array(typecode, columns[name]))
+
+        meta['products_rows'] = len(rows)
+        meta['product_names'] = list(names)
+        meta['categories'] = {str(row[0]): row[1] for row in db.get_categories_db()}
+
+    # -- READ --
+
+    # Map a column file and return a memoryview of its first rows (zero copy, read only)
+    def _map_column(self, path, typecode, rows):
+
+        itemsize = array(typecode).itemsize
+
+        if rows == 0:
+            return memoryview(array(typecode))
+
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return memoryview(mapped)[:rows * itemsize].cast(typecode)
+
+    # Open function. Return (meta, sales, products): sales and products are dicts of read-only memoryviews, one per column,
+    # mapped from the files (only the rows counted in the meta). Return (None, {}, {}) if there is no snapshot
+    def open(self):
+
+        meta = self.read_meta()
+
+        if meta is None:
+            return None, {}, {}
+
+        sales = {name: self._map_column(self._column_path('sales', name, meta['generation']), typecode, meta['sales_rows'])
+                 for name, typecode in SALES_COLUMNS}
+        products = {name: self._map_column(self._column_path('products', name, meta['products_number']), typecode, meta['products_rows'])
+                    for name, typecode in PRODUCT_COLUMNS}
+
+        return meta, sales, products
+
+    # Open numpy function. Same as open() but every column is a read-only numpy.memmap (needs NumPy)
+    def open_numpy(self):
+
+        import numpy as np
+
+        meta = self.read_meta()
+
+        if meta is None:
+            return None, {}, {}
+
+        def load(table, columns, number, rows):
+            return {
+                name: np.memmap(self._column_path(table, name, number), dtype=NUMPY_DTYPES[typecode], mode='r', shape=(rows,))
+                if rows else np.empty(0, dtype=NUMPY_DTYPES[typecode])
+                for name, typecode in columns
+            }
+
+        sales = load('sales', SALES_COLUMNS, meta['generation'], meta['sales_rows'])
+        products = load('products', PRODUCT_COLUMNS, meta['products_number'], meta['products_rows'])
+
+        return meta, sales, products
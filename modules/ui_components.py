@@ -84,9 +84,12 @@ class ProductForm(LabelFrame):
 
 
 class SearchForm(LabelFrame):
-    # Constructor
-    def __init__(self, parent, title = 'Search Product'):
+    # Constructor. delay: milliseconds without typing before the incremental search runs (debounce)
+    def __init__(self, parent, title = 'Search Product', delay=250):
             super().__init__(parent, text=title) 
+            self.delay = delay
+            self.on_type = None
+            self._after_id = None
             self.init_widgets()
 
     # Initialize Search widgets
@@ -96,6 +99,7 @@ class SearchForm(LabelFrame):
         Label(self, text='Search by Name:').grid(row=0, column=0, padx=5, pady=5)
         self.search_entry = Entry(self)
         self.search_entry.grid(row=0,column=1, padx=5, pady=5)
+        self.search_entry.bind('<KeyRelease>', self.on_key_release)
 
         # Search Button
         self.btn_search = ttk.Button(self, text='Search')
@@ -109,13 +113,51 @@ class SearchForm(LabelFrame):
     def get_search_term(self):
         
         return self.search_entry.get()
+
+    # Set the function called with the search term while the user types (search-as-you-type)
+    def set_incremental_search(self, callback):
+
+        self.on_type = callback
+
+    # Key release event. Every key restarts the timer, so the search only runs when the user stops typing
+    def on_key_release(self, event=None):
+
+        if self.on_type is None:
+            return
+
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+
+        self._after_id = self.after(self.delay, self.run_incremental_search)
+
+    # Run the incremental search with the current text
+    def run_incremental_search(self):
+
+        self._after_id = None
+        self.on_type(self.get_search_term())
     
 
 class ProductTree(ttk.Treeview):
 
     # Constructor
-    def __init__(self, parent):
+    # page_size: rows requested to the database every time the user reaches the top or the bottom in virtual mode.
+    # max_items: maximum rows kept as real Treeview items in virtual mode. The rest are dropped and loaded again when needed
+    def __init__(self, parent, page_size=100, max_items=300):
         super().__init__(parent, height=10, columns=('#1','#2','#3'), selectmode=BROWSE)   
+
+        self.page_size = page_size
+        self.max_items = max(max_items, page_size * 2)
+
+        # Virtual mode state
+        self.loader = None
+        self.has_more_before = False
+        self.has_more_after = False
+        self._loading = False
+
+        # External scrollbar (optional). The tree needs the scroll events for itself, so they are forwarded
+        self.scroll_callback = None
+        self.configure(yscrollcommand=self.on_yscroll)
+
         self.init_config()
 
 
@@ -128,17 +170,119 @@ class ProductTree(ttk.Treeview):
         self.heading('#2', text='Stock', anchor=CENTER)
         self.heading('#3', text='Category_ID', anchor=CENTER)
 
-    # Clean visual rows
+    # Clean visual rows. Delete all the items in a single call
     def clean_rows(self):
 
         records = self.get_children()
-        for element in records:
-             self.delete(element)
+        if records:
+            self.delete(*records)
 
     # Add a row
     def add_row(self, name, price, stock, category_id):
 
         self.insert('', 0, text=name, values=(price, stock, category_id,))
+
+    # Insert product rows (ProductRecord) at a position keeping their order
+    def insert_product_rows(self, rows, index='end'):
+
+        for offset, row in enumerate(rows):
+
+            position = index + offset if index != 'end' else 'end'
+            self.insert('', position, text=row.name, values=(row.price, row.stock, row.category_id,))
+
+    # -- VIRTUAL MODE --
+    # Only a window of rows (max_items) exists as Treeview items. When the user scrolls near the top or the bottom,
+    # the next page is requested to the loader and the rows on the other side are dropped.
+    # loader(after_name, before_name, limit) must return the product rows ordered by name (ascending):
+    # the rows after after_name, or the rows just before before_name, or the first rows if both are None.
+
+    # Load virtual function. Start showing the first page of the loader.
+    # first_rows: the first page if it was already loaded (for example in a background thread)
+    def load_virtual(self, loader, first_rows=None):
+
+        self.loader = loader
+        self.clean_rows()
+
+        rows = first_rows if first_rows is not None else loader(None, None, self.page_size)
+        self.insert_product_rows(rows)
+
+        self.has_more_before = False
+        self.has_more_after = len(rows) == self.page_size
+        self.yview_moveto(0)
+
+    # Stop the virtual mode (the rows already loaded are kept)
+    def stop_virtual(self):
+
+        self.loader = None
+        self.has_more_before = False
+        self.has_more_after = False
+
+    # Scroll event. Forward it to the scrollbar and load more rows if we are close to an edge
+    def on_yscroll(self, first, last):
+
+        if self.scroll_callback:
+            self.scroll_callback(first, last)
+
+        if self.loader is None or self._loading:
+            return
+
+        if float(last) >= 0.95 and self.has_more_after:
+            self._loading = True
+            self.after_idle(self.load_next_page)
+
+        elif float(first) <= 0.05 and self.has_more_before:
+            self._loading = True
+            self.after_idle(self.load_previous_page)
+
+    # Load the page after the last visible row and drop the first rows if the window is full
+    def load_next_page(self):
+
+        try:
+            children = self.get_children()
+            if self.loader is None or not children:
+                return
+
+            last_item = children[-1]
+            rows = self.loader(str(self.item(last_item, 'text')), None, self.page_size)
+            self.has_more_after = len(rows) == self.page_size
+
+            self.insert_product_rows(rows)
+
+            overflow = len(children) + len(rows) - self.max_items
+            if overflow > 0:
+                self.delete(*children[:overflow])
+                self.has_more_before = True
+
+            # Keep the row the user was looking at in the view
+            self.see(last_item)
+
+        finally:
+            self._loading = False
+
+    # Load the page before the first visible row and drop the last rows if the window is full
+    def load_previous_page(self):
+
+        try:
+            children = self.get_children()
+            if self.loader is None or not children:
+                return
+
+            first_item = children[0]
+            rows = self.loader(None, str(self.item(first_item, 'text')), self.page_size)
+            self.has_more_before = len(rows) == self.page_size
+
+            self.insert_product_rows(rows, 0)
+
+            overflow = len(children) + len(rows) - self.max_items
+            if overflow > 0:
+                self.delete(*children[-overflow:])
+                self.has_more_after = True
+
+            # Keep the row the user was looking at in the view
+            self.see(first_item)
+
+        finally:
+            self._loading = False
     
     # Get selected item
     def get_selected_item(self):
@@ -638,11 +782,23 @@ class ClientManagerWindow(Toplevel):
 # Sales Report Window
 class SalesReportWindow(Toplevel):
 
-    def __init__(self, parent):
+    # Constructor. page_size: sales loaded every time the user reaches the end of the list
+    def __init__(self, parent, page_size=200):
         super().__init__(parent)
         self.title('Sales Report History')
         self.geometry('1200x600')
         self.transient(parent) # It makes the window visualize above the main window
+
+        # Paging state
+        self.page_size = page_size
+        self.page_loader = None
+        self.next_cursor = None
+        self._loading = False
+
+        # Running totals of the loaded sales
+        self.loaded_count = 0
+        self.running_total = 0.0
+
         self.init_widgets()
 
     
@@ -656,12 +812,12 @@ class SalesReportWindow(Toplevel):
         tree_frame.pack(fill=BOTH, expand=True, padx=10, pady=10)
 
         # Scrollbar
-        scrollbar = Scrollbar(tree_frame)
-        scrollbar.pack(side=RIGHT, fill=Y)
+        self.scrollbar = Scrollbar(tree_frame)
+        self.scrollbar.pack(side=RIGHT, fill=Y)
 
-        # Treeview Configuration
+        # Treeview Configuration. The scroll events go to on_yscroll first to load more pages
         columns = ('id','product','client','quantity','total','date')
-        self.tree = ttk.Treeview(tree_frame, columns=columns, show='headings', yscrollcommand=scrollbar.set)
+        self.tree = ttk.Treeview(tree_frame, columns=columns, show='headings', yscrollcommand=self.on_yscroll)
 
         # Headers
         self.tree.heading('id', text='ID')
@@ -680,28 +836,82 @@ class SalesReportWindow(Toplevel):
         self.tree.column('date', width=150, anchor=CENTER)
 
         self.tree.pack(side=LEFT, fill=BOTH, expand=True)
-        scrollbar.config(command=self.tree.yview)
+        self.scrollbar.config(command=self.tree.yview)
+
+        # Running total of the loaded sales
+        self.total_label = Label(self, text='', font=('Arial', 10, 'bold'))
+        self.total_label.pack(pady=5)
 
         # Close Button
         Button(self, text='Close', command=self.destroy, bg='gray', fg='white').pack(pady=10)
 
 
-    # Load data function
+    # Load data function. Replace the content with a list of rows
     def load_data(self, data_rows):
 
-        for row in self.tree.get_children():
-            self.tree.delete(row)
+        self.page_loader = None
+        self.next_cursor = None
+        self.clear_rows()
+        self.append_rows(data_rows)
+
+    # Load pages function. page_loader(cursor, limit) must return (rows, next_cursor). Only the first page is loaded now,
+    # the next ones are requested when the user scrolls to the end.
+    # first_page: the (rows, next_cursor) of the first page if it was already loaded (for example in a background thread)
+    def load_pages(self, page_loader, first_page=None):
+
+        self.page_loader = page_loader
+        self.clear_rows()
+
+        rows, self.next_cursor = first_page if first_page is not None else page_loader(None, self.page_size)
+        self.append_rows(rows)
 
+    # Clear all the rows and totals
+    def clear_rows(self):
+
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+
+        self.loaded_count = 0
+        self.running_total = 0.0
+        self.update_total_label()
+
+    # Add rows at the end and update the running total
+    def append_rows(self, data_rows):
 
         for row in data_rows:
 
-            id_sale, prod, cli, qty, total, date = row
-            total_formatted = f"{total:.2f}"
+            total_formatted = f"{row.total:.2f}"
+
+            self.tree.insert('', END, values=(row.id, row.product, row.client, row.quantity, total_formatted, row.date))
 
-            self.tree.insert('', END, values=(id_sale, prod, cli, qty, total_formatted, date))      
+            self.loaded_count += 1
+            self.running_total += row.total
 
+        self.update_total_label()
 
+    # Show the running total
+    def update_total_label(self):
 
+        more = ' (scroll down to load more)' if self.next_cursor else ''
+        self.total_label['text'] = f'Sales loaded: {self.loaded_count} - Running total: ${self.running_total:.2f}{more}'
 
+    # Scroll event. Move the scrollbar and load the next page when the end of the list is visible
+    def on_yscroll(self, first, last):
 
+        self.scrollbar.set(first, last)
+
+        if self.page_loader and self.next_cursor and not self._loading and float(last) >= 0.95:
+            self._loading = True
+            self.after_idle(self.load_next_page)
+
+    # Load the next page of sales
+    def load_next_page(self):
+
+        try:
+            if self.page_loader and self.next_cursor:
+                rows, self.next_cursor = self.page_loader(self.next_cursor, self.page_size)
+                self.append_rows(rows)
 
+        finally:
+            self._loading = False